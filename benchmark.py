@@ -0,0 +1,282 @@
+import argparse
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tokenize
+
+try:
+    import resource
+except ImportError:
+    resource = None #Not available on Windows, peak memory is left out there.
+
+EDITOR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "text-editor.py")
+
+def load_editor():
+    spec = importlib.util.spec_from_file_location("text_editor", EDITOR_PATH)
+    editor = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(editor)
+    return editor
+
+def make_python_corpus(line_count):
+    with open(EDITOR_PATH) as file:
+        lines = file.read().splitlines()
+    repeats = line_count // len(lines) + 1
+    return "\n".join((lines * repeats)[:line_count])
+
+def tokenize_tags(editor, text):
+    #The tokenize based path the editor used before the regex lexer, kept here for comparison.
+    tokens = []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(text).readline):
+            tokens.append(token)
+    except (tokenize.TokenError, IndentationError):
+        pass #An unclosed string turns the rest of the corpus into tokens tokenize can't follow.
+    tags = []
+    function_next = False
+    for index, token in enumerate(tokens):
+        tag = None
+        if token.type == tokenize.COMMENT:
+            tag = "comments"
+        elif token.type == tokenize.STRING:
+            tag = "strings"
+        elif token.type == tokenize.NUMBER:
+            tag = "numbers"
+        elif token.type == tokenize.NAME:
+            tag, function_next = editor.TextEditor.check_names(token.string, function_next)
+        elif token.type == tokenize.OP:
+            tag = "op"
+        if index > 0 and tag == "builtins":
+            prev_token = tokens[index - 1]
+            if prev_token.type == tokenize.OP and prev_token.string == ".":
+                tag = "names"
+        if tag:
+            tags.append((tag, token.start, token.end))
+    return tags
+
+def regex_tags(editor, text):
+    return list(editor.PythonLexer().lex(text))
+
+def best_time(function, repeats):
+    best = None
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def bench_lexers(editor, line_counts, repeats):
+    results = {}
+    print(f"{'lines':>8} {'case':>12} {'tokenize ms':>12} {'tokens':>8} {'regex ms':>10} {'tokens':>8} {'speedup':>8}")
+    for line_count in line_counts:
+        corpus = make_python_corpus(line_count)
+        cases = (("complete", corpus), ("unclosed", 's = """\n' + corpus))
+        for case, text in cases:
+            old_time, old_tags = best_time(lambda: tokenize_tags(editor, text), repeats)
+            new_time, new_tags = best_time(lambda: regex_tags(editor, text), repeats)
+            print(f"{line_count:>8} {case:>12} {old_time * 1000:>12.1f} {len(old_tags):>8} "
+                  f"{new_time * 1000:>10.1f} {len(new_tags):>8} {old_time / new_time:>7.1f}x")
+            results[f"lexer/{case}/{line_count}"] = {"seconds": new_time, "tokenize_seconds": old_time}
+    return results
+
+def make_text_corpus(line_count):
+    words = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do",
+             "eiusmod", "tempor", "incididunt", "ut", "labore", "et", "dolore", "magna", "aliqua")
+    generator = random.Random(line_count) #Seeded so every run searches the same text.
+    return "\n".join(" ".join(generator.choices(words, k=generator.randint(4, 14))) for _ in range(line_count))
+
+def start_virtual_display():
+    #Tk needs an X server, so without one the suite runs under a private Xvfb.
+    if os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin"):
+        return None
+    if shutil.which("Xvfb") is None:
+        sys.exit("The editor suite needs a display: install Xvfb or set DISPLAY.")
+    read_end, write_end = os.pipe()
+    server = subprocess.Popen(["Xvfb", "-displayfd", str(write_end), "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+                              pass_fds=(write_end,), stderr=subprocess.DEVNULL)
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        display = pipe.readline().strip() #Xvfb writes the display number it picked once it is ready.
+    if not display:
+        server.kill()
+        sys.exit("Xvfb failed to start.")
+    os.environ["DISPLAY"] = f":{display}"
+    return server
+
+def peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 #Bytes on macOS, kilobytes elsewhere.
+
+def wait_until(window, condition, timeout=600):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("The editor did not finish within the benchmark timeout.")
+        window.update()
+        time.sleep(0.0005)
+
+def timed_until(window, action, condition):
+    start = time.perf_counter()
+    action()
+    wait_until(window, condition)
+    return time.perf_counter() - start
+
+def highlighter_idle(highlighter):
+    return highlighter.job_after_id is None and highlighter.poll_after_id is None and highlighter.apply_after_id is None
+
+def close_tab(text_editor):
+    text_editor.tab.modified = False #Nothing the benchmark typed needs keeping.
+    text_editor.close_tab()
+
+def bench_startup(budget_ms=60000):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, EDITOR_PATH, "--startup-check", str(budget_ms)], check=True, stdout=subprocess.DEVNULL)
+    return {"seconds": time.perf_counter() - start}
+
+def bench_open_save(text_editor, path):
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    open_time = timed_until(text_editor.window, lambda: text_editor.load_file(path), lambda: text_editor.loader is None)
+    text_editor.text_box.insert("1.0", " ") #Saving writes the whole buffer whatever changed.
+    save_time = timed_until(text_editor.window, text_editor.save, lambda: text_editor.tab.saver is None)
+    return ({"seconds": open_time, "mb_per_s": size_mb / open_time},
+            {"seconds": save_time, "mb_per_s": size_mb / save_time})
+
+def bench_keystrokes(text_editor, keystrokes):
+    window = text_editor.window
+    highlighter = text_editor.highlighter
+    first_view = timed_until(window, lambda: (highlighter.reset(), text_editor.highlight_text()),
+                             lambda: highlighter_idle(highlighter))
+    text_editor.text_box.mark_set("insert", "1.0")
+    latencies = []
+    for _ in range(keystrokes):
+        #The same steps as typing: the insert, then the <KeyRelease> handler, so the highlighter's debounce is included.
+        latencies.append(timed_until(window, lambda: (text_editor.text_box.insert("insert", "x"), text_editor.highlight_text()),
+                                     lambda: highlighter_idle(highlighter)))
+    return ({"seconds": first_view},
+            {"seconds": statistics.median(latencies), "max_seconds": max(latencies)})
+
+def bench_find_replace(editor, text_editor, word, replacement):
+    window = text_editor.window
+    dialogue = editor.ReplaceDialogue(text_editor.text_box, text_editor.document, text_editor.undo_history)
+    dialogue.user_input.set(word)
+    dialogue.cancel_type_delay() #Searching is started directly rather than after the typing delay.
+    dialogue.replace_input.set(replacement)
+    find_time = timed_until(window, dialogue.find_matches, lambda: dialogue.search_done)
+    match_count = len(dialogue.matches)
+    replace_time = timed_until(window, lambda: dialogue.replace_all_matches(replacement), lambda: True)
+    dialogue.close()
+    undo_time = timed_until(window, text_editor.undo, lambda: True)
+    redo_time = timed_until(window, text_editor.redo, lambda: True)
+    return ({"seconds": find_time, "matches": match_count},
+            {"seconds": replace_time, "matches": match_count},
+            {"seconds": undo_time},
+            {"seconds": redo_time})
+
+CORPORA = {"python": (".py", make_python_corpus, "self", "this"),
+           "text": (".txt", make_text_corpus, "lorem", "ipsum")}
+
+def bench_case(editor, corpus, line_count, keystrokes):
+    extension, make_corpus, word, replacement = CORPORA[corpus]
+    text_editor = editor.TextEditor(recover=False)
+    text_editor.window.update()
+    case = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"{corpus}_{line_count}{extension}")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(make_corpus(line_count))
+        case["open"], case["save"] = bench_open_save(text_editor, path)
+        if corpus == "python":
+            case["highlight_first_view"], case["keystroke_highlight"] = bench_keystrokes(text_editor, keystrokes)
+        case["find"], case["replace_all"], case["undo"], case["redo"] = bench_find_replace(editor, text_editor, word, replacement)
+        close_tab(text_editor)
+    text_editor.destroy()
+    case["peak_memory"] = {"mb": peak_memory_mb()}
+    return case
+
+def bench_editor(line_counts, keystrokes):
+    results = {"startup": bench_startup()}
+    print(f"{'startup':>24} {results['startup']['seconds'] * 1000:>10.1f} ms")
+    for line_count in line_counts:
+        for corpus in CORPORA:
+            #Each case gets its own process, the peak memory is only ever a process-wide high-water mark.
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "editor", "--case", corpus, str(line_count),
+                                     "--keystrokes", str(keystrokes)], check=True, stdout=subprocess.PIPE, text=True).stdout
+            case = json.loads(output.splitlines()[-1])
+            for name, result in case.items():
+                results[f"{name}/{corpus}/{line_count}"] = result
+                if "seconds" in result:
+                    print(f"{name + '/' + corpus + '/' + str(line_count):>24} {result['seconds'] * 1000:>10.1f} ms")
+    return results
+
+def compare(results, baseline, tolerance):
+    #Times and memory are both lower-is-better, anything over the tolerance counts as a regression.
+    regressions = []
+    print(f"{'metric':>28} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        for key in ("seconds", "mb"):
+            if result.get(key) is None or not old.get(key):
+                continue
+            change = result[key] / old[key] - 1
+            flag = ""
+            if change > tolerance:
+                flag = " slower" if key == "seconds" else " larger"
+                regressions.append(name)
+            print(f"{name:>28} {old[key]:>12.4f} {result[key]:>12.4f} {change:>+7.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the editor's hot paths.")
+    parser.add_argument("suite", nargs="?", choices=("lexers", "editor"), default="lexers",
+                        help="lexers compares the highlighting lexers, editor drives a real TextEditor")
+    parser.add_argument("--lines", type=int, nargs="+")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--keystrokes", type=int, default=20)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against results saved earlier with --json")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown before a result is a regression")
+    parser.add_argument("--case", nargs=2, metavar=("CORPUS", "LINES"), help=argparse.SUPPRESS) #One editor case, run by the suite itself.
+    args = parser.parse_args()
+    display_server = None
+    try:
+        if args.suite == "lexers":
+            results = bench_lexers(load_editor(), args.lines or [1000, 10000, 100000], args.repeats)
+        else:
+            display_server = start_virtual_display()
+            if args.case:
+                print(json.dumps(bench_case(load_editor(), args.case[0], int(args.case[1]), args.keystrokes)))
+                return
+            results = bench_editor(args.lines or [1000, 10000, 100000, 1000000], args.keystrokes)
+    finally:
+        if display_server is not None:
+            display_server.terminate()
+    report = {"suite": args.suite, "python": platform.python_version(), "platform": platform.platform(),
+              "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions over {args.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,23 @@ from tkinter import ttk
 from tkinter import filedialog
 from tkinter import messagebox
 from tkinter import font
+from tkinter import simpledialog
 from typing import Optional
 import os
 import keyword
-import tokenize
-import io
 import builtins
 import re
+import abc
 import sys
-import subprocess
+import threading
+import time
+import queue
+import json
+import bisect
+import codecs
+from collections import deque, Counter
+
+LOADED = time.perf_counter() #Where check_startup measures from when the process start time can't be read.
 
 def get_dunder_methods():
     types_to_check = [
@@ -27,235 +35,3288 @@ def get_dunder_methods():
                     dunders.add(name)
     return dunders
 
-class FindDialogue:
+def split_index(index):
+    line, col = index.split(".")
+    return int(line), int(col)
+
+def advance_index(index, text):
+    line, col = split_index(index)
+    newlines = text.count("\n")
+    if newlines:
+        return f"{line + newlines}.{len(text) - text.rfind(chr(10)) - 1}"
+    return f"{line}.{col + len(text)}"
+
+def keep_ends(text):
+    #Lines with their newlines, so a run of them maps straight onto a Text range.
+    lines = text.split("\n")
+    return [line + "\n" for line in lines[:-1]] + ([lines[-1]] if lines[-1] else [])
+
+def line_changes(old, new, limit):
+    prefix = 0
+    shortest = min(len(old), len(new))
+    while prefix < shortest and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < shortest - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    old_end, new_end = len(old) - suffix, len(new) - suffix
+    if prefix == old_end and prefix == new_end:
+        return []
+    if old_end - prefix + new_end - prefix > limit:
+        return [(prefix, old_end, prefix, new_end)] #Too big to diff quickly, replaced as one block.
+    import difflib #Deferred, only needed when a file changes on disk.
+    matcher = difflib.SequenceMatcher(None, old[prefix:old_end], new[prefix:new_end], autojunk=False)
+    return [(prefix + old_start, prefix + old_stop, prefix + new_start, prefix + new_stop)
+            for operation, old_start, old_stop, new_start, new_stop in matcher.get_opcodes() if operation != "equal"]
+
+class EditObserver:
     def __init__(self, text_box):
         self.text_box = text_box
-        self.find_window = self.setup_window()
-        self.window_frame = ttk.Frame(self.find_window, padding=(10,10,15,15))
-        find_frame = ttk.Frame(self.window_frame)
-        self.entry_frame = ttk.Frame(find_frame)
-        self.next_frame = ttk.Frame(find_frame)
-        self.dir_frame = ttk.Frame(find_frame)
-        self.direction_var = tk.StringVar()
-        self.user_input = tk.StringVar()
-        self.regex = ""
-        self.entry_text = ""
-        self.matches = []
-        self.clicked_next = False
-        self.find_index = -1
-        self.cursor_index = 0
-        self.word_var = tk.IntVar(value=1)
-        self.wrap_var = tk.IntVar(value=1)
-        self.match_all_var = tk.IntVar(value=0)
-        self.create_dialogue()
-        self.entry_frame.pack(fill="x", expand=True)
-        self.next_frame.pack(fill="x", expand=True)
-        self.dir_frame.pack(fill="x", expand=True)
-        find_frame.pack(fill="x")
-        self.window_frame.pack()
+        self.listeners = []
+        self.widget_name = text_box._w
+        self.orig_name = self.widget_name + "_orig"
+        self.callback_name = self.widget_name + "_edit"
+        text_box.tk.call("rename", self.widget_name, self.orig_name)
+        text_box.tk.createcommand(self.callback_name, self.dispatch)
+        #Only edits are routed through Python, every other widget command stays in Tcl.
+        text_box.tk.eval(f"""proc {self.widget_name} {{command args}} {{
+            if {{$command in {{insert delete replace}} && [{self.orig_name} cget -state] eq "normal"}} {{
+                lassign [{self.callback_name} $command {{*}}$args] status result
+                return -code $status $result
+            }}
+            tailcall {self.orig_name} $command {{*}}$args
+        }}""")
 
-    def setup_window(self):
-        find_window = tk.Toplevel()
-        find_window.transient(self.text_box.winfo_toplevel())
-        find_window.grab_set()
-        find_window.focus_force()
-        find_window.protocol("WM_DELETE_WINDOW", self.close)
-        find_window.title("Find")
-        return find_window
+    def add_listener(self, listener):
+        self.listeners.append(listener)
 
-    def create_options(self):
-        options_label = ttk.Label(self.next_frame, text="Options:")
-        options_label.pack(side="left", padx=(0, 10))
-        whole_word_radio = ttk.Checkbutton(self.next_frame, variable=self.word_var, text="Whole word")
-        wrap_around_radio = ttk.Checkbutton(self.next_frame, variable=self.wrap_var, text="Wrap around")
-        match_all = ttk.Checkbutton(self.next_frame, text="Match all", variable=self.match_all_var)
-        whole_word_radio.pack(side="left")
-        wrap_around_radio.pack(side="left")
-        match_all.pack(side="left")
+    def close(self):
+        #The interpreter holds the callback, and through it every listener, until it is deleted.
+        self.listeners = []
+        self.text_box.tk.deletecommand(self.callback_name)
+        self.text_box.tk.call("rename", self.widget_name, "")
+        self.text_box.tk.call("rename", self.orig_name, self.widget_name)
 
-    def create_dialogue(self):
-        self.create_options()
-        self.create_find_label()
-        self.create_find_entry()
-        self.create_close_button()
-        self.create_direction_label()
-        self.create_radio_buttons()
-        self.create_next_button()
+    def call(self, *args):
+        return self.text_box.tk.call(self.orig_name, *args)
 
-    def create_find_label(self):
-        find_label = ttk.Label(self.entry_frame, text="Find:", font=(font.nametofont("TkDefaultFont"), 10))
-        find_label.pack(side="left", padx=(0, 5))
+    def dispatch(self, command, *args):
+        #Errors from the widget itself, like a bad index, go back to the caller as Tcl errors.
+        try:
+            if command == "insert":
+                return "ok", self.insert(*args)
+            if command == "delete":
+                return "ok", self.delete(*args)
+            return "ok", self.replace(*args)
+        except tk.TclError as error:
+            return "error", str(error)
 
-    def create_find_entry(self):
-        find_entry = ttk.Entry(self.entry_frame, width=55, textvariable=self.user_input)
-        find_entry.bind("<Return>", self.find)
-        find_entry.focus_set()
-        find_entry.pack(side="left", fill="x", expand=True)
+    @staticmethod
+    def clamp(index, last_index):
+        if split_index(index) > split_index(last_index):
+            return last_index
+        return index
 
-    def create_radio_buttons(self):
-        up_radio = ttk.Radiobutton(self.dir_frame, variable=self.direction_var, text="Up", value="Up")
-        down_radio = ttk.Radiobutton(self.dir_frame, variable=self.direction_var, text="Down", value="Down")
-        self.direction_var.set("Down")
-        up_radio.pack(side="left")
-        down_radio.pack(side="left")
+    def insert(self, index, *args):
+        #Tk inserts anything at or past "end" before the final newline, whatever form the index takes.
+        start = self.clamp(self.call("index", index), self.call("index", "end-1c"))
+        result = self.call("insert", start, *args)
+        text = "".join(args[::2])
+        if text:
+            self.notify("insert", start, advance_index(start, text), text)
+        return result
 
-    def create_close_button(self):
-        close_button = ttk.Button(self.entry_frame, text="Close", command=self.close)
-        close_button.pack(side="right", anchor="e", padx=8)
+    def delete(self, *args):
+        if len(args) > 2:
+            pairs = [args[index:index + 2] for index in range(0, len(args), 2)]
+            pairs.sort(key=lambda pair: split_index(self.call("index", pair[0])), reverse=True)
+            for pair in pairs:
+                self.delete(*pair)
+            return ""
+        last_index = self.call("index", "end-1c")
+        start = self.clamp(self.call("index", args[0]), last_index)
+        if len(args) > 1:
+            end = self.clamp(self.call("index", args[1]), last_index)
+        else:
+            end = self.clamp(self.call("index", f"{start}+1c"), last_index)
+        if split_index(start) >= split_index(end):
+            return ""
+        text = self.call("get", start, end)
+        result = self.call("delete", start, end)
+        self.notify("delete", start, end, text)
+        return result
 
-    def create_next_button(self):
-        next_button = ttk.Button(self.next_frame, text="Find Next", command=self.find)
-        next_button.pack(side="right", anchor="e",padx=(0, 8), pady=(5, 0))
+    def replace(self, first, last, *args):
+        start = self.call("index", first)
+        self.delete(start, last)
+        return self.insert(start, *args)
 
-    def create_direction_label(self):
-        direction_label = ttk.Label(self.dir_frame, text="Direction:", font=(font.nametofont("TkDefaultFont"), 10))
-        direction_label.pack(side="left")
+    def notify(self, operation, start, end, text):
+        for listener in self.listeners:
+            try:
+                listener(operation, start, end, text)
+            except Exception:
+                self.text_box._report_exception() #Reported like any Tk callback error, later listeners still get the edit.
+
+class TclBatch:
+    MAX_RANGES = 5000
+    #Text edits aren't batched, they have to go through EditObserver one at a time so its listeners see each one.
+    total_operations = 0
+    total_calls = 0
+
+    def __init__(self, text_box):
+        self.text_box = text_box
+        self.widget_name = text_box._w
+        self.tag_changes = {}
+        self.queued = 0
+
+    def tag_add(self, tag, start, end):
+        self.tag_changes.setdefault(("add", tag), []).extend((start, end))
+        self.queued += 1
+
+    def tag_remove(self, tag, start, end):
+        self.tag_changes.setdefault(("remove", tag), []).extend((start, end))
+        self.queued += 1
+
+    def flush(self):
+        calls = 0
+        #Removals go first so a range that is removed and re-added in the same batch keeps its tag.
+        for (operation, tag), ranges in sorted(self.tag_changes.items(), key=lambda item: item[0][0] != "remove"):
+            for start in range(0, len(ranges), self.MAX_RANGES * 2):
+                self.text_box.tk.call(self.widget_name, "tag", operation, tag, *ranges[start:start + self.MAX_RANGES * 2])
+                calls += 1
+        self.tag_changes = {}
+        TclBatch.total_operations += self.queued
+        TclBatch.total_calls += calls
+        self.queued = 0
+
+class UndoHistory:
+    OP_OVERHEAD = 120 #Rough size of the list and index strings kept with each operation.
+
+    def __init__(self, text_box, budget):
+        self.text_box = text_box
+        self.budget = budget
+        self.undo_groups = deque()
+        self.redo_groups = []
+        self.size = 0
+        self.group_open = False
+        self.applying = False
+        self.paused = False
+
+    @staticmethod
+    def op_size(text):
+        return sys.getsizeof(text) + UndoHistory.OP_OVERHEAD
+
+    def group_size(self, group):
+        return sum(self.op_size(text) for _, _, text in group)
+
+    def clear(self):
+        self.undo_groups.clear()
+        self.redo_groups.clear()
+        self.size = 0
+        self.group_open = False
+
+    def checkpoint(self):
+        self.group_open = False
+
+    def text_edited(self, operation, start, end, text):
+        if self.applying or self.paused:
+            return
+        for group in self.redo_groups:
+            self.size -= self.group_size(group)
+        self.redo_groups.clear()
+        if not self.group_open or not self.undo_groups:
+            self.undo_groups.append([])
+            self.group_open = True
+        group = self.undo_groups[-1]
+        if not group or not self.merge(group[-1], operation, start, end, text):
+            group.append([operation, start, text])
+            self.size += self.op_size(text)
+        self.trim()
+
+    def merge(self, last_op, operation, start, end, text):
+        kind, last_start, last_text = last_op
+        if kind != operation:
+            return False
+        if operation == "insert" and start == advance_index(last_start, last_text):
+            last_op[2] = last_text + text #Typing at the end of the previous insert.
+        elif operation == "delete" and end == last_start:
+            last_op[1] = start #Backspace just before the previous delete.
+            last_op[2] = text + last_text
+        elif operation == "delete" and start == last_start:
+            last_op[2] = last_text + text #Forward delete at the same position.
+        else:
+            return False
+        self.size += sys.getsizeof(last_op[2]) - sys.getsizeof(last_text)
+        return True
+
+    def trim(self):
+        while self.size > self.budget and len(self.undo_groups) > 1:
+            self.size -= self.group_size(self.undo_groups.popleft())
+
+    def apply(self, operation, start, text):
+        if operation == "insert":
+            self.text_box.insert(start, text)
+            return advance_index(start, text)
+        self.text_box.delete(start, advance_index(start, text))
+        return start
+
+    def undo(self):
+        self.group_open = False
+        if not self.undo_groups:
+            return None
+        group = self.undo_groups.pop()
+        self.applying = True
+        try:
+            for operation, start, text in reversed(group):
+                self.apply("delete" if operation == "insert" else "insert", start, text)
+        finally:
+            self.applying = False
+        self.redo_groups.append(group)
+        return group[0][1]
+
+    def redo(self):
+        self.group_open = False
+        if not self.redo_groups:
+            return None
+        group = self.redo_groups.pop()
+        index = None
+        self.applying = True
+        try:
+            for operation, start, text in group:
+                index = self.apply(operation, start, text)
+        finally:
+            self.applying = False
+        self.undo_groups.append(group)
+        return index
+
+def config_dir():
+    base = os.environ.get("APPDATA") or os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    path = os.path.join(base, "texteditor")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def process_alive(pid):
+    if os.name == "nt":
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid) #PROCESS_QUERY_LIMITED_INFORMATION
+        if handle:
+            ctypes.windll.kernel32.CloseHandle(handle)
+            return True
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class JournalWriter:
+    def __init__(self):
+        self.tasks = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, action, journal_path, header=None, records=()):
+        self.tasks.put((action, journal_path, header, records))
+
+    def run(self):
+        while True:
+            task = self.tasks.get()
+            try:
+                self.handle(*task)
+            except OSError:
+                pass #A journal that can't be written shouldn't take the editor down with it.
+
+    @staticmethod
+    def encode_header(header):
+        header = dict(header)
+        if header.get("text") is not None:
+            import base64, zlib #Deferred, only a checkpoint stores the whole text.
+            header["text"] = base64.b64encode(zlib.compress(header["text"].encode("utf-8"))).decode("ascii")
+        return json.dumps(header) + "\n"
+
+    def handle(self, action, journal_path, header, records):
+        if action == "remove":
+            if os.path.exists(journal_path):
+                os.remove(journal_path)
+            return
+        lines = [json.dumps(record) + "\n" for record in records]
+        if action == "checkpoint":
+            temp_path = journal_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                file.write(self.encode_header(header))
+                file.writelines(lines)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, journal_path)
+            return
+        with open(journal_path, "a", encoding="utf-8") as file:
+            if header is not None:
+                file.write(self.encode_header(header))
+            file.writelines(lines)
+            file.flush()
+            os.fsync(file.fileno()) #One fsync for every batch of edits.
+
+def content_hash(data):
+    import hashlib #Deferred, nothing is hashed until a file is opened or saved.
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def thaw(value):
+    #JSON turns tuples into lists, lexer states and tags are compared and hashed as tuples.
+    if isinstance(value, list):
+        return tuple(thaw(item) for item in value)
+    return value
+
+class SessionStore:
+    RECENT_FILES = 10
+    FILE_LIMIT = 1000 #Files whose cursor, scroll and mode are remembered.
+    TOKEN_BYTES = 64 * 1024 * 1024 #Compressed highlighting kept before the least recently used is evicted.
+    ENTRY_BYTES = 8 * 1024 * 1024
+    INDEXED_FILES = 20000 #Files in the project symbol index before the least recently indexed are dropped.
+    SCHEMA = """
+        PRAGMA synchronous = NORMAL;
+        CREATE TABLE IF NOT EXISTS recent_files (path TEXT PRIMARY KEY, used REAL);
+        CREATE TABLE IF NOT EXISTS file_state (path TEXT PRIMARY KEY, cursor TEXT, scroll REAL,
+                                               python_mode INTEGER, word_wrap INTEGER, used REAL);
+        CREATE TABLE IF NOT EXISTS token_cache (hash TEXT PRIMARY KEY, data BLOB, size INTEGER, used REAL);
+        CREATE TABLE IF NOT EXISTS indexed_files (path TEXT PRIMARY KEY, directory TEXT, mtime REAL, used REAL);
+        CREATE TABLE IF NOT EXISTS symbols (name TEXT, kind TEXT, path TEXT, line INTEGER, col INTEGER);
+        CREATE INDEX IF NOT EXISTS indexed_files_by_directory ON indexed_files (directory);
+        CREATE INDEX IF NOT EXISTS symbols_by_name ON symbols (name);
+        CREATE INDEX IF NOT EXISTS symbols_by_path ON symbols (path);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+        self.sqlite3 = None
+        self.failed = False
+
+    def connect(self):
+        if self.connection is None:
+            import sqlite3 #Deferred, nothing reads the store until after the first window is up.
+            self.sqlite3 = sqlite3
+            self.connection = sqlite3.connect(self.path)
+            self.connection.executescript(self.SCHEMA)
+        return self.connection
+
+    def execute(self, statement, parameters=()):
+        return self.transaction(lambda connection: connection.execute(statement, parameters).fetchall())
+
+    def transaction(self, work):
+        if self.failed:
+            return []
+        try:
+            with self.connect() as connection: #Commits on success.
+                return work(connection)
+        except Exception as error:
+            if self.sqlite3 is None or not isinstance(error, self.sqlite3.Error):
+                raise
+            self.failed = True #A locked or damaged store only costs the cache, editing carries on.
+            return []
+
+    def recent_files(self):
+        rows = self.execute("SELECT path FROM recent_files ORDER BY used DESC LIMIT ?", (self.RECENT_FILES,))
+        return [row[0] for row in rows]
+
+    def touch_recent(self, file_path):
+        self.execute("INSERT OR REPLACE INTO recent_files VALUES (?, ?)", (file_path, time.time()))
+        self.execute("DELETE FROM recent_files WHERE path NOT IN "
+                     "(SELECT path FROM recent_files ORDER BY used DESC LIMIT ?)", (self.RECENT_FILES,))
+
+    def forget_recent(self, file_path):
+        self.execute("DELETE FROM recent_files WHERE path = ?", (file_path,))
+
+    def file_state(self, file_path):
+        rows = self.execute("SELECT cursor, scroll, python_mode, word_wrap FROM file_state WHERE path = ?", (file_path,))
+        if not rows:
+            return None
+        cursor, scroll, python_mode, word_wrap = rows[0]
+        return {"cursor": cursor, "scroll": scroll, "python_mode": bool(python_mode), "word_wrap": bool(word_wrap)}
+
+    def save_file_state(self, file_path, cursor, scroll, python_mode, word_wrap):
+        self.execute("INSERT OR REPLACE INTO file_state VALUES (?, ?, ?, ?, ?, ?)",
+                     (file_path, cursor, scroll, python_mode, word_wrap, time.time()))
+        self.execute("DELETE FROM file_state WHERE path NOT IN "
+                     "(SELECT path FROM file_state ORDER BY used DESC LIMIT ?)", (self.FILE_LIMIT,))
+
+    def tokens(self, file_hash):
+        rows = self.execute("SELECT data FROM token_cache WHERE hash = ?", (file_hash,))
+        if not rows:
+            return None
+        self.execute("UPDATE token_cache SET used = ? WHERE hash = ?", (time.time(), file_hash))
+        import zlib #Deferred like sqlite3.
+        return json.loads(zlib.decompress(rows[0][0]))
+
+    def indexed_files(self, directory):
+        return dict(self.execute("SELECT path, mtime FROM indexed_files WHERE directory = ?", (directory,)))
+
+    def save_symbols(self, directory, present, results):
+        def work(connection):
+            rows = connection.execute("SELECT path FROM indexed_files WHERE directory = ?", (directory,)).fetchall()
+            removed = {row[0] for row in rows} - set(present)
+            for path in removed.union(path for path, _, _ in results):
+                connection.execute("DELETE FROM symbols WHERE path = ?", (path,))
+                connection.execute("DELETE FROM indexed_files WHERE path = ?", (path,))
+            now = time.time()
+            for path, mtime, symbols in results:
+                connection.executemany("INSERT INTO symbols VALUES (?, ?, ?, ?, ?)",
+                                       [(name, kind, path, line, column) for name, kind, line, column, _ in symbols])
+                connection.execute("INSERT INTO indexed_files VALUES (?, ?, ?, ?)", (path, directory, mtime, now))
+            connection.execute("UPDATE indexed_files SET used = ? WHERE directory = ?", (now, directory))
+            stale = connection.execute("SELECT path FROM indexed_files ORDER BY used DESC LIMIT -1 OFFSET ?",
+                                       (self.INDEXED_FILES,)).fetchall()
+            connection.executemany("DELETE FROM symbols WHERE path = ?", stale)
+            connection.executemany("DELETE FROM indexed_files WHERE path = ?", stale)
+        self.transaction(work)
+
+    def find_symbol(self, name):
+        rows = self.execute("SELECT path, line, col FROM symbols WHERE name = ? ORDER BY kind = 'variable' LIMIT 1", (name,))
+        return rows[0] if rows else None
+
+    def save_tokens(self, file_hash, cache):
+        import zlib
+        data = zlib.compress(json.dumps(cache, separators=(",", ":")).encode("utf-8"))
+        if len(data) > self.ENTRY_BYTES:
+            return
+        self.execute("INSERT OR REPLACE INTO token_cache VALUES (?, ?, ?, ?)", (file_hash, data, len(data), time.time()))
+        total = 0
+        for cached_hash, size in self.execute("SELECT hash, size FROM token_cache ORDER BY used DESC"):
+            total += size
+            if total > self.TOKEN_BYTES and cached_hash != file_hash:
+                self.execute("DELETE FROM token_cache WHERE hash = ?", (cached_hash,))
+
+class EditJournal:
+    FLUSH_MS = 1000
+    COMPACT_BYTES = 4 * 1024 * 1024
+    writer: Optional[JournalWriter] = None
+    count = 0
+
+    def __init__(self, text_box, document):
+        self.text_box = text_box
+        self.document = document
+        self.journal_path = os.path.join(EditJournal.journal_dir(), f"{os.getpid()}-{EditJournal.count}.journal")
+        EditJournal.count += 1
+        self.header = {"path": None, "size": None, "mtime": None, "text": ""}
+        self.header_written = False
+        self.pending = []
+        self.written_bytes = 0
+        self.paused = False
+        self.flush_after_id: Optional[str] = None
+        if EditJournal.writer is None:
+            EditJournal.writer = JournalWriter()
+
+    @staticmethod
+    def journal_dir():
+        path = os.path.join(config_dir(), "journal")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def reset(self, file_path=None):
+        self.cancel_flush()
+        self.pending = []
+        self.written_bytes = 0
+        self.header = {"path": file_path, "size": None, "mtime": None, "text": None}
+        if file_path is not None and os.path.exists(file_path):
+            stat = os.stat(file_path)
+            self.header["size"] = stat.st_size
+            self.header["mtime"] = stat.st_mtime_ns
+        else:
+            self.header["text"] = ""
+        self.header_written = False
+        self.writer.submit("remove", self.journal_path)
+
+    def discard(self):
+        self.cancel_flush()
+        self.pending = []
+        self.header_written = False
+        self.writer.submit("remove", self.journal_path)
+
+    def cancel_flush(self):
+        if self.flush_after_id is not None:
+            self.text_box.after_cancel(self.flush_after_id)
+            self.flush_after_id = None
+
+    def text_edited(self, operation, start, end, text):
+        if self.paused:
+            return
+        last_record = self.pending[-1] if self.pending else None
+        if operation == "insert":
+            if last_record and last_record[0] == "i" and start == advance_index(last_record[1], last_record[2]):
+                last_record[2] += text
+            else:
+                self.pending.append(["i", start, text])
+        else:
+            self.pending.append(["d", start, end])
+        self.written_bytes += len(text)
+        if self.flush_after_id is None:
+            self.flush_after_id = self.text_box.after(self.FLUSH_MS, self.flush)
+
+    def flush(self):
+        self.flush_after_id = None
+        if not self.pending:
+            return
+        if self.written_bytes > self.COMPACT_BYTES:
+            self.snapshot()
+            return
+        header = None if self.header_written else self.header
+        self.writer.submit("append", self.journal_path, header, self.pending)
+        self.header_written = True
+        self.pending = []
+
+    def snapshot(self):
+        self.header = dict(self.header, text=self.document.text())
+        self.writer.submit("checkpoint", self.journal_path, self.header)
+        self.header_written = True
+        self.pending = []
+        self.written_bytes = 0
+
+    @staticmethod
+    def orphaned_journals():
+        journals = []
+        journal_dir = EditJournal.journal_dir()
+        for name in os.listdir(journal_dir):
+            if not name.endswith(".journal"):
+                continue
+            try:
+                pid = int(name.split("-")[0])
+            except ValueError:
+                continue
+            if pid != os.getpid() and not process_alive(pid):
+                journals.append(os.path.join(journal_dir, name))
+        return sorted(journals, key=os.path.getmtime, reverse=True)
+
+    @staticmethod
+    def read(journal_path):
+        header = None
+        records = []
+        with open(journal_path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break #The last line may have been cut short by the crash.
+                if header is None:
+                    header = record
+                else:
+                    records.append(record)
+        return header, records
+
+    @staticmethod
+    def base_text(header):
+        if header.get("text") is not None:
+            import base64, zlib
+            return zlib.decompress(base64.b64decode(header["text"])).decode("utf-8")
+        file_path = header.get("path")
+        if file_path is None or not os.path.exists(file_path):
+            return None
+        stat = os.stat(file_path)
+        if stat.st_size != header.get("size") or stat.st_mtime_ns != header.get("mtime"):
+            return None #The file changed on disk since the journal started, the edits no longer line up.
+        with open(file_path, "rb") as file:
+            return FileLoader.decode(file.read())[0]
+
+class FileLoader:
+    ENCODINGS = ("utf-8", "cp1252", "latin-1")
+    BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+    CHUNK_CHARS = 256 * 1024
+    SLICE_MS = 15 #Time spent inserting chunks before handing control back to the event loop.
+    POLL_MS = 5
+
+    def __init__(self, text_box, file_path, on_progress, on_done):
+        self.text_box = text_box
+        self.file_path = file_path
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.size = os.path.getsize(file_path)
+        self.encoding = "utf-8"
+        self.newline: Optional[str] = None
+        self.error: Optional[OSError] = None
+        self.content_hash: Optional[str] = None
+        self.total_chars: Optional[int] = None
+        self.loaded_chars = 0
+        self.started = time.perf_counter()
+        self.chunks = queue.Queue()
+        self.cancelled = threading.Event()
+        threading.Thread(target=self.read, daemon=True).start()
+        self.after_id: Optional[str] = text_box.after(self.POLL_MS, self.insert_chunks)
+
+    @staticmethod
+    def decode(data):
+        for bom, encoding in FileLoader.BOMS:
+            if data.startswith(bom):
+                text = data.decode(encoding, "replace")
+                break
+        else:
+            for encoding in FileLoader.ENCODINGS:
+                try:
+                    text = data.decode(encoding)
+                    break
+                except UnicodeDecodeError:
+                    continue
+        if "\r\n" in text:
+            newline = "\r\n"
+        elif "\r" in text:
+            newline = "\r"
+        else:
+            newline = "\n"
+        if newline != "\n":
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text, encoding, newline
+
+    def read(self):
+        try:
+            with open(self.file_path, "rb") as file:
+                data = file.read()
+        except OSError as error:
+            self.error = error
+            self.chunks.put(None)
+            return
+        self.content_hash = content_hash(data)
+        text, self.encoding, self.newline = self.decode(data)
+        del data
+        self.total_chars = len(text)
+        start = 0
+        while start < len(text) and not self.cancelled.is_set():
+            end = text.find("\n", start + self.CHUNK_CHARS) + 1 #Chunks end on whole lines.
+            if end == 0:
+                end = len(text)
+            self.chunks.put(text[start:end])
+            start = end
+        self.chunks.put(None)
+
+    def insert_chunks(self):
+        self.after_id = None
+        deadline = time.perf_counter() + self.SLICE_MS / 1000
+        while time.perf_counter() < deadline:
+            try:
+                chunk = self.chunks.get_nowait()
+            except queue.Empty:
+                break
+            if chunk is None:
+                self.on_done(self)
+                return
+            self.text_box.config(state="normal")
+            self.text_box.insert("end", chunk)
+            self.text_box.config(state="disabled") #Keeps typing out until the whole file is in.
+            self.loaded_chars += len(chunk)
+        self.on_progress(self)
+        self.after_id = self.text_box.after(self.POLL_MS, self.insert_chunks)
+
+    def progress(self):
+        if not self.total_chars:
+            return 0.0
+        return self.loaded_chars / self.total_chars
+
+    def throughput(self):
+        elapsed = time.perf_counter() - self.started
+        return elapsed, self.size / max(elapsed, 1e-6)
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.after_id is not None:
+            self.text_box.after_cancel(self.after_id)
+            self.after_id = None
+        self.text_box.config(state="normal")
+
+class FileSaver:
+    CHUNK_BYTES = 1024 * 1024
+    POLL_MS = 20
+
+    def __init__(self, text_box, file_path, text, version, encoding, newline, on_progress, on_done):
+        self.text_box = text_box
+        self.file_path = file_path
+        self.version = version
+        self.encoding = encoding
+        self.newline = newline or os.linesep
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.total_bytes = 0
+        self.written_bytes = 0
+        self.content_hash: Optional[str] = None
+        self.error: Optional[Exception] = None
+        self.done = False
+        self.started = time.perf_counter()
+        #Not a daemon, so the interpreter waits for a save in progress before exiting.
+        self.thread = threading.Thread(target=self.write, args=(text,))
+        self.thread.start()
+        self.after_id: Optional[str] = text_box.after(self.POLL_MS, self.poll)
+
+    def write(self, text):
+        target_path = os.path.realpath(self.file_path) #A symlink is written through, not replaced by a plain file.
+        directory = os.path.dirname(target_path)
+        temp_path = os.path.join(directory, f".{os.path.basename(target_path)}.{os.getpid()}.tmp")
+        try:
+            if self.newline != "\n":
+                text = text.replace("\n", self.newline)
+            data = memoryview(text.encode(self.encoding))
+            self.content_hash = content_hash(data)
+            self.total_bytes = len(data)
+            try:
+                self.write_file(temp_path, data)
+                keeps_owner = True
+                if os.path.exists(target_path):
+                    import shutil #Deferred, only needed once a save replaces an existing file.
+                    shutil.copymode(target_path, temp_path)
+                    keeps_owner = self.copy_owner(target_path, temp_path)
+                if keeps_owner:
+                    os.replace(temp_path, target_path) #Atomic, the file on disk is always the old or the new version.
+                else:
+                    #Replacing the file would hand it over to us, so it is overwritten where it is instead.
+                    os.remove(temp_path)
+                    self.written_bytes = 0
+                    self.write_file(target_path, data)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            self.sync_directory(directory)
+        except (OSError, UnicodeEncodeError) as error:
+            self.error = error
+        self.done = True
+
+    def write_file(self, path, data):
+        with open(path, "wb") as file:
+            for start in range(0, len(data), self.CHUNK_BYTES):
+                self.written_bytes += file.write(data[start:start + self.CHUNK_BYTES])
+            file.flush()
+            os.fsync(file.fileno())
+
+    @staticmethod
+    def copy_owner(source_path, path):
+        if not hasattr(os, "chown"):
+            return True #No owners to keep on Windows.
+        source, stat = os.stat(source_path), os.stat(path)
+        if (source.st_uid, source.st_gid) == (stat.st_uid, stat.st_gid):
+            return True
+        try:
+            os.chown(path, source.st_uid, source.st_gid)
+        except OSError:
+            return False
+        return True
+
+    @staticmethod
+    def sync_directory(directory):
+        if os.name == "nt":
+            return #Windows can't open a directory to fsync it, the rename is already durable there.
+        try:
+            directory_descriptor = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(directory_descriptor) #Makes the rename itself survive a crash.
+        except OSError:
+            pass
+        finally:
+            os.close(directory_descriptor)
+
+    def poll(self):
+        self.after_id = None
+        if self.done:
+            self.on_done(self)
+        else:
+            self.on_progress(self)
+            self.after_id = self.text_box.after(self.POLL_MS, self.poll)
+
+    def progress(self):
+        if not self.total_bytes:
+            return 0.0
+        return self.written_bytes / self.total_bytes
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def wait(self):
+        #The caller handles the result itself, so the poll that would report it is dropped.
+        self.thread.join()
+        if self.after_id is not None:
+            self.text_box.after_cancel(self.after_id)
+            self.after_id = None
+
+class FileReader:
+    POLL_MS = 20
+
+    def __init__(self, text_box, file_path, known_hash, on_done):
+        #Reads a file changed on disk off the event loop, the bytes are only decoded if they differ from known_hash.
+        self.text_box = text_box
+        self.file_path = file_path
+        self.known_hash = known_hash
+        self.on_done = on_done
+        self.error: Optional[OSError] = None
+        self.content_hash: Optional[str] = None
+        self.text: Optional[str] = None
+        self.encoding = "utf-8"
+        self.newline: Optional[str] = None
+        self.done = False
+        threading.Thread(target=self.read, daemon=True).start()
+        self.after_id: Optional[str] = text_box.after(self.POLL_MS, self.poll)
+
+    def read(self):
+        try:
+            with open(self.file_path, "rb") as file:
+                data = file.read()
+        except OSError as error:
+            self.error = error
+        else:
+            self.content_hash = content_hash(data)
+            if self.content_hash != self.known_hash:
+                self.text, self.encoding, self.newline = FileLoader.decode(data)
+        self.done = True
+
+    def poll(self):
+        self.after_id = None
+        if self.done:
+            self.on_done(self)
+        else:
+            self.after_id = self.text_box.after(self.POLL_MS, self.poll)
+
+    def cancel(self):
+        if self.after_id is not None:
+            self.text_box.after_cancel(self.after_id)
+            self.after_id = None
+
+class Document:
+    BLOCK_SIZE = 512 #Lines are kept in blocks so edits only touch one block and the block prefix sums.
+
+    def __init__(self, text=""):
+        self.version = 0
+        self.set_text(text)
+
+    def set_text(self, text):
+        lines = text.split("\n")
+        self.blocks = [lines[index:index + self.BLOCK_SIZE] for index in range(0, len(lines), self.BLOCK_SIZE)]
+        self.block_chars = [self.count_chars(block) for block in self.blocks]
+        self.block_offsets = [None] * len(self.blocks)
+        self.line_prefix = []
+        self.char_prefix = []
+        self.prefix_dirty = True
+        self.cached_text = text
+        self.version += 1
+
+    @staticmethod
+    def count_chars(block):
+        return sum(map(len, block)) + len(block)
+
+    def update_prefix(self):
+        if self.prefix_dirty:
+            import itertools #Deferred, nothing needs it until a document is edited.
+            self.line_prefix = list(itertools.accumulate(map(len, self.blocks), initial=0))
+            self.char_prefix = list(itertools.accumulate(self.block_chars, initial=0))
+            self.prefix_dirty = False
+
+    def offsets(self, block_index):
+        offsets = self.block_offsets[block_index]
+        if offsets is None:
+            import itertools
+            offsets = list(itertools.accumulate((len(line) + 1 for line in self.blocks[block_index]), initial=0))
+            self.block_offsets[block_index] = offsets
+        return offsets
+
+    def locate(self, line):
+        self.update_prefix()
+        block_index = min(bisect.bisect_right(self.line_prefix, line - 1) - 1, len(self.blocks) - 1)
+        row = min(line - 1 - self.line_prefix[block_index], len(self.blocks[block_index]) - 1)
+        return block_index, row
+
+    def line_count(self):
+        self.update_prefix()
+        return self.line_prefix[-1]
+
+    def __len__(self):
+        self.update_prefix()
+        return self.char_prefix[-1] - 1
+
+    def line(self, line):
+        block_index, row = self.locate(line)
+        return self.blocks[block_index][row]
+
+    def lines(self, first, last):
+        first = max(first, 1)
+        last = min(last, self.line_count())
+        if first > last:
+            return []
+        block_index, row = self.locate(first)
+        lines = []
+        while len(lines) <= last - first and block_index < len(self.blocks):
+            block = self.blocks[block_index]
+            lines.extend(block[row:row + last - first + 1 - len(lines)])
+            block_index += 1
+            row = 0
+        return lines
+
+    def line_start(self, line):
+        block_index, row = self.locate(line)
+        return self.char_prefix[block_index] + self.offsets(block_index)[row]
+
+    def index_to_offset(self, index):
+        line, col = split_index(index)
+        return self.line_start(line) + col
+
+    def position(self, offset):
+        self.update_prefix()
+        block_index = min(bisect.bisect_right(self.char_prefix, offset) - 1, len(self.blocks) - 1)
+        local_offset = offset - self.char_prefix[block_index]
+        offsets = self.offsets(block_index)
+        row = min(bisect.bisect_right(offsets, local_offset) - 1, len(self.blocks[block_index]) - 1)
+        return self.line_prefix[block_index] + row + 1, local_offset - offsets[row]
+
+    def offset_to_index(self, offset):
+        line, col = self.position(offset)
+        return f"{line}.{col}"
+
+    def search_source(self):
+        return ("text", self.text())
+
+    def text(self):
+        if self.cached_text is None:
+            import itertools
+            self.cached_text = "\n".join(itertools.chain.from_iterable(self.blocks))
+        return self.cached_text
+
+    def substring(self, start, end):
+        if self.cached_text is not None:
+            return self.cached_text[start:end]
+        start_line, start_col = self.position(start)
+        end_line, end_col = self.position(end)
+        lines = self.lines(start_line, end_line)
+        if len(lines) == 1:
+            return lines[0][start_col:end_col]
+        lines[0] = lines[0][start_col:]
+        lines[-1] = lines[-1][:end_col]
+        return "\n".join(lines)
+
+    def text_edited(self, operation, start, end, text):
+        if operation == "insert":
+            self.insert(start, text)
+        else:
+            self.delete(start, end)
+
+    def insert(self, index, text):
+        line, col = split_index(index)
+        block_index, row = self.locate(line)
+        block = self.blocks[block_index]
+        current = block[row]
+        block[row:row + 1] = (current[:col] + text + current[col:]).split("\n")
+        self.block_changed(block_index)
+
+    def delete(self, start, end):
+        start_line, start_col = split_index(start)
+        end_line, end_col = split_index(end)
+        start_block, start_row = self.locate(start_line)
+        end_block, end_row = self.locate(end_line)
+        merged = self.blocks[start_block][start_row][:start_col] + self.blocks[end_block][end_row][end_col:]
+        if start_block == end_block:
+            self.blocks[start_block][start_row:end_row + 1] = [merged]
+        else:
+            self.blocks[start_block][start_row:] = [merged]
+            del self.blocks[end_block][:end_row + 1]
+            for block_list in (self.blocks, self.block_chars, self.block_offsets):
+                del block_list[start_block + 1:end_block]
+            if self.blocks[start_block + 1]:
+                self.block_changed(start_block + 1)
+            else:
+                for block_list in (self.blocks, self.block_chars, self.block_offsets):
+                    del block_list[start_block + 1]
+        self.block_changed(start_block)
+
+    def block_changed(self, block_index):
+        block = self.blocks[block_index]
+        if len(block) > self.BLOCK_SIZE * 2:
+            pieces = [block[index:index + self.BLOCK_SIZE] for index in range(0, len(block), self.BLOCK_SIZE)]
+            self.blocks[block_index:block_index + 1] = pieces
+            self.block_chars[block_index:block_index + 1] = [self.count_chars(piece) for piece in pieces]
+            self.block_offsets[block_index:block_index + 1] = [None] * len(pieces)
+        else:
+            self.block_chars[block_index] = self.count_chars(block)
+            self.block_offsets[block_index] = None
+        self.prefix_dirty = True
+        self.cached_text = None
+        self.version += 1
+
+class PagedFile:
+    INDEX_STEP = 64 * 1024 #One index entry per this many bytes keeps the index sparse but lookups short.
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file = open(file_path, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        import mmap #Deferred, only very large files and searches map files.
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index_lines = [1]
+        self.index_offsets = [0]
+        self.indexed = False
+        self.total_lines: Optional[int] = None
+        self.closed = threading.Event()
+        self.index_thread = threading.Thread(target=self.build_index, daemon=True)
+        self.index_thread.start()
+
+    def build_index(self):
+        line = 1
+        offset = 0
+        try:
+            for boundary in range(self.INDEX_STEP, self.size, self.INDEX_STEP):
+                if self.closed.is_set():
+                    return
+                line_start = self.data.find(b"\n", boundary) + 1
+                if line_start == 0 or line_start <= offset:
+                    continue
+                line += self.data[offset:line_start].count(b"\n")
+                offset = line_start
+                self.index_lines.append(line) #Lines first, readers only trust entries that have an offset.
+                self.index_offsets.append(offset)
+            if not self.closed.is_set():
+                self.total_lines = line + self.data[offset:].count(b"\n")
+                self.indexed = True
+        except ValueError:
+            pass #The file was closed while indexing.
+
+    def line_start(self, offset):
+        return self.data.rfind(b"\n", 0, offset) + 1
+
+    def next_line(self, offset):
+        line_end = self.data.find(b"\n", offset)
+        return self.size if line_end == -1 else line_end + 1
+
+    def line_at(self, offset):
+        count = len(self.index_offsets)
+        entry = bisect.bisect_right(self.index_offsets, offset, 0, count) - 1
+        if entry == count - 1 and not self.indexed and offset - self.index_offsets[entry] > self.INDEX_STEP:
+            return None #Not indexed yet.
+        return self.index_lines[entry] + self.data[self.index_offsets[entry]:offset].count(b"\n")
+
+    def line_offset(self, line):
+        count = len(self.index_offsets)
+        entry = bisect.bisect_right(self.index_lines, line, 0, count) - 1
+        if entry == count - 1 and not self.indexed:
+            return None
+        offset = self.index_offsets[entry]
+        for _ in range(line - self.index_lines[entry]):
+            offset = self.next_line(offset)
+            if offset >= self.size:
+                break
+        return offset
+
+    def close(self):
+        self.closed.set()
+        self.index_thread.join()
+        self.data.close()
+        self.file.close()
+
+class FileViewer:
+    PAGE_BYTES = 512 * 1024
+    EDGE = 0.15 #Fraction of the page left above or below the view before the next page is swapped in.
+    version = 0
+
+    def __init__(self, text_box, scrollbar, file_path):
+        self.text_box = text_box
+        self.scrollbar = scrollbar
+        self.paged_file = PagedFile(file_path)
+        self.page_start = 0
+        self.page_end = 0
+        self.page_offsets = [0]
+        self.loading = False
+        self.scrollbar.config(command=self.scroll)
+        self.load_page(0)
+
+    def search_source(self):
+        return ("file", self.paged_file.file_path)
+
+    def load_page(self, start):
+        paged_file = self.paged_file
+        start = paged_file.line_start(min(max(start, 0), paged_file.size))
+        end = min(start + self.PAGE_BYTES, paged_file.size)
+        if end < paged_file.size:
+            end = max(paged_file.line_start(end), paged_file.next_line(start)) #Whole lines unless one line fills the page.
+        if (start, end) == (self.page_start, self.page_end) and self.page_offsets[-1] == end:
+            return
+        page = paged_file.data[start:end]
+        self.page_offsets = [start] + [start + match.end() for match in re.finditer(b"\n", page)]
+        if self.page_offsets[-1] != end:
+            self.page_offsets.append(end)
+        self.page_start = start
+        self.page_end = end
+        self.loading = True
+        try:
+            self.text_box.config(state="normal")
+            self.text_box.delete("1.0", "end")
+            self.text_box.insert("1.0", page.decode("utf-8", "replace").replace("\r\n", "\n"))
+            self.text_box.config(state="disabled")
+            self.text_box.edit_modified(False)
+        finally:
+            self.loading = False
+
+    def local_line(self, offset):
+        return min(bisect.bisect_right(self.page_offsets, offset), len(self.page_offsets) - 1)
+
+    def show_offset(self, offset):
+        #Swap in the page around offset and put its line at the top of the view.
+        if not self.page_start <= offset < self.page_end or offset == self.paged_file.size:
+            self.load_page(offset - self.PAGE_BYTES // 2)
+        self.text_box.yview(f"{self.local_line(offset)}.0")
+
+    def top_offset(self):
+        top_line = split_index(self.text_box.index("@0,0"))[0]
+        return self.page_offsets[min(top_line, len(self.page_offsets)) - 1]
+
+    def scroll(self, *args):
+        if args[0] == "moveto":
+            offset = self.paged_file.next_line(int(float(args[1]) * self.paged_file.size)) if float(args[1]) > 0 else 0
+            self.show_offset(min(offset, self.paged_file.size))
+        else:
+            self.text_box.yview(*args)
+
+    def view_changed(self, first, last):
+        first, last = float(first), float(last)
+        size = max(self.paged_file.size, 1)
+        page_size = self.page_end - self.page_start
+        self.scrollbar.set((self.page_start + first * page_size) / size, (self.page_start + last * page_size) / size)
+        if self.loading:
+            return
+        if (first < self.EDGE and self.page_start > 0) or (last > 1 - self.EDGE and self.page_end < self.paged_file.size):
+            top = self.top_offset()
+            self.load_page(top - self.PAGE_BYTES // 2)
+            self.text_box.yview(f"{self.local_line(top)}.0")
+
+    def offset_to_index(self, offset):
+        if not self.page_start <= offset <= self.page_end:
+            self.show_offset(offset)
+        line = self.local_line(offset)
+        line_start = self.page_offsets[line - 1]
+        column = len(self.paged_file.data[line_start:offset].decode("utf-8", "replace"))
+        return f"{line}.{column}"
+
+    def span_to_indices(self, start, end):
+        #Both ends from one page, mapping them one at a time could swap pages in between.
+        if not self.page_start <= start <= end <= self.page_end:
+            self.load_page(start - self.PAGE_BYTES // 2)
+        return self.offset_to_index(start), self.offset_to_index(min(end, self.page_end))
+
+    def index_to_offset(self, index):
+        line, column = split_index(self.text_box.index(index))
+        line_start = self.page_offsets[min(line, len(self.page_offsets)) - 1]
+        line_text = self.text_box.get(f"{line}.0", f"{line}.{column}")
+        return line_start + len(line_text.encode("utf-8"))
+
+    def line_number(self, index):
+        line, _ = split_index(self.text_box.index(index))
+        return self.paged_file.line_at(self.page_offsets[min(line, len(self.page_offsets)) - 1])
+
+    def go_to_line(self, line):
+        offset = self.paged_file.line_offset(line)
+        if offset is None:
+            return False
+        self.show_offset(offset)
+        self.text_box.mark_set("insert", f"{self.local_line(offset)}.0")
+        return True
+
+    def close(self):
+        self.paged_file.close()
+
+class Lexer(abc.ABC):
+    INITIAL_STATE = None
+
+    @abc.abstractmethod
+    def lex_line(self, line, state):
+        pass
+
+    def lex(self, text):
+        offset = 0
+        state = self.INITIAL_STATE
+        tokens = []
+        for line in text.split("\n"):
+            line_tokens, state = self.lex_line(line, state)
+            tokens.extend((tag, offset + start, offset + end) for tag, start, end in line_tokens)
+            offset += len(line) + 1
+        return tokens
+
+class PythonLexer(Lexer):
+    #(Open triple quote delimiter, function_next). Bracket depth is left out, no tag depends on it and an
+    #unbalanced bracket would stop every later checkpoint matching, so one keystroke would re-lex the rest of the file.
+    INITIAL_STATE = (None, False)
+    STRING_PREFIX = r"(?:[rRbBuUfF]|[rR][bBfF]|[bBfF][rR])?"
+    #One combined pattern, the group that matched is the tag name. Unterminated strings stop at the end of the line.
+    TOKEN_PATTERN = re.compile(
+        r"(?P<comments>#.*)"
+        r"|(?P<triple>" + STRING_PREFIX + r"(?:'''|\"\"\"))"
+        r"|(?P<strings>" + STRING_PREFIX + r"""(?:'(?:[^'\\\n]|\\.)*'?|"(?:[^"\\\n]|\\.)*"?))"""
+        r"|(?P<numbers>(?:0[xX][\da-fA-F_]+|0[bB][01_]+|0[oO][0-7_]+"
+        r"|(?:\d[\d_]*(?:\.[\d_]*)?|\.\d[\d_]*)(?:[eE][+-]?\d[\d_]*)?[jJ]?))"
+        r"|(?P<names>[^\W\d]\w*)"
+    )
+    TRIPLE_END_PATTERNS = {
+        "'''": re.compile(r"(?:[^'\\]|\\[\s\S]|'(?!''))*'''"),
+        '"""': re.compile(r'(?:[^"\\]|\\[\s\S]|"(?!""))*"""'),
+    }
+
+    def find_string_end(self, text, position, delimiter):
+        match = self.TRIPLE_END_PATTERNS[delimiter].match(text, position)
+        if match is None:
+            return -1
+        return match.end()
+
+    @staticmethod
+    def follows_dot(text, position):
+        position -= 1
+        while position >= 0 and text[position] in " \t":
+            position -= 1
+        return position >= 0 and text[position] == "."
+
+    def lex_line(self, line, state):
+        delimiter, function_next = state
+        tokens = []
+        position = 0
+        if delimiter:
+            end = self.find_string_end(line, 0, delimiter)
+            if end < 0:
+                if line:
+                    tokens.append(("strings", 0, len(line)))
+                return tokens, state
+            tokens.append(("strings", 0, end))
+            position = end
+        search = self.TOKEN_PATTERN.search
+        while True:
+            match = search(line, position)
+            if match is None:
+                break
+            kind = match.lastgroup
+            start, position = match.span()
+            if kind == "triple":
+                delimiter = line[position - 3:position]
+                end = self.find_string_end(line, position, delimiter)
+                if end < 0:
+                    tokens.append(("strings", start, len(line))) #Recover by running the string to the end.
+                    return tokens, (delimiter, function_next)
+                tokens.append(("strings", start, end))
+                position = end
+                continue
+            if kind == "names":
+                kind, function_next = TextEditor.check_names(match.group(), function_next)
+                if kind == "builtins" and self.follows_dot(line, start):
+                    kind = "names"
+            tokens.append((kind, start, position))
+        return tokens, (None, function_next)
+
+    def lex(self, text):
+        tokens, _ = self.lex_line(text, self.INITIAL_STATE) #The patterns never cross a line except inside triple quotes.
+        return tokens
+
+LEXERS = {}
+
+def register_lexer(extensions, lexer):
+    for extension in extensions:
+        LEXERS[extension.lower()] = lexer
+
+def lexer_for(file_name):
+    _, extension = os.path.splitext(file_name)
+    return LEXERS.get(extension.lower())
+
+register_lexer((".py", ".pyw"), PythonLexer)
+
+class SyntaxHighlighter:
+    TAGS = ("comments", "strings", "keywords", "names", "builtins", "self", "dunders", "numbers", "functions")
+    VIEWPORT_MARGIN = 100
+    DEBOUNCE_MS = 30
+    SCROLL_DELAY_MS = 5
+    POLL_MS = 10
+    APPLY_SLICE = 150
+
+    def __init__(self, text_box, document, lexer, viewport_only=True, margin=VIEWPORT_MARGIN, threaded=True):
+        self.text_box = text_box
+        self.document = document
+        self.lexer = lexer
+        self.viewport_only = viewport_only
+        self.margin = margin
+        self.worker = HighlightWorker(lexer) if threaded else None
+        self.batch = TclBatch(text_box)
+        self.generation = 0 #Bumped on every edit so results lexed from older snapshots can be dropped.
+        self.enabled = False
+        self.line_states = [] #Lexer state at the start of each line, used as checkpoints.
+        self.line_tags = [] #Tags currently applied to each line, None when unknown after an edit.
+        self.line_fresh = [] #True when a line's tags were lexed from its current text and saved state.
+        self.verified = 0 #Checkpoints up to and including this line are known to be correct.
+        self.job_after_id: Optional[str] = None
+        self.poll_after_id: Optional[str] = None
+        self.apply_after_id: Optional[str] = None
+
+    def set_lexer(self, lexer):
+        if type(lexer) is type(self.lexer):
+            return
+        self.lexer = lexer
+        if self.worker is not None:
+            self.worker.lexer = lexer
+        if self.enabled:
+            self.reset()
+
+    def reset(self):
+        self.enabled = True
+        line_count = self.document.line_count()
+        self.line_states = [self.lexer.INITIAL_STATE] + [None] * (line_count - 1)
+        self.line_tags = [[]] * line_count
+        self.line_fresh = [False] * line_count
+        self.verified = 0
+        self.cancel_jobs()
+        self.bump_generation()
+        self.remove_tags("1.0", "end")
+        self.batch.flush()
+
+    def export_cache(self):
+        #Checkpoints that are known to be right, plus the tags of lines lexed from them.
+        if not self.enabled or not self.line_states:
+            return None
+        rows = min(self.verified + 1, len(self.line_states))
+        tags = [row_tags if fresh else None for row_tags, fresh in zip(self.line_tags[:rows], self.line_fresh[:rows])]
+        return {"lexer": type(self.lexer).__name__, "states": self.line_states[:rows + 1], "tags": tags}
+
+    def restore_cache(self, cache):
+        states = cache["states"]
+        if cache["lexer"] != type(self.lexer).__name__ or not self.enabled or len(states) > len(self.line_states):
+            return False
+        for row, state in enumerate(states):
+            self.line_states[row] = thaw(state)
+        for row, tags in enumerate(cache["tags"]):
+            if tags is not None:
+                self.apply_tags(row, [tuple(tag) for tag in tags])
+                self.line_fresh[row] = True
+        self.verified = len(cache["tags"]) - 1
+        self.batch.flush()
+        return True
+
+    def clear(self):
+        self.enabled = False
+        self.line_states = []
+        self.line_tags = []
+        self.line_fresh = []
+        self.verified = 0
+        self.cancel_jobs()
+        self.remove_tags("1.0", "end")
+        self.batch.flush()
+
+    def remove_tags(self, start, end):
+        for tag in SyntaxHighlighter.TAGS:
+            self.batch.tag_remove(tag, start, end)
+
+    def text_edited(self, operation, start, end, text):
+        if not self.enabled:
+            return
+        start_row = split_index(start)[0] - 1
+        end_row = split_index(end)[0] - 1
+        lines = end_row - start_row
+        if operation == "insert":
+            self.line_states[start_row + 1:start_row + 1] = [None] * lines
+            self.line_tags[start_row:start_row + 1] = [None] * (lines + 1)
+            self.line_fresh[start_row:start_row + 1] = [False] * (lines + 1)
+        else:
+            del self.line_states[start_row + 1:end_row + 1]
+            self.line_tags[start_row:end_row + 1] = [None]
+            self.line_fresh[start_row:end_row + 1] = [False]
+        self.verified = min(self.verified, start_row)
+        self.bump_generation()
+
+    def bump_generation(self):
+        self.generation += 1
+        if self.worker is not None:
+            self.worker.generation = self.generation
+
+    def clear_unknown_lines(self, first, last):
+        run_start = None
+        for row in range(first, last + 2):
+            unknown = row <= last and self.line_tags[row] is None
+            if unknown and run_start is None:
+                run_start = row
+            elif not unknown and run_start is not None:
+                self.remove_tags(f"{run_start + 1}.0", f"{row + 1}.0")
+                self.line_tags[run_start:row] = [[]] * (row - run_start)
+                run_start = None
+
+    def apply_tags(self, row, tags):
+        old_tags = self.line_tags[row]
+        if old_tags == tags:
+            return
+        line = row + 1
+        old_set = set(old_tags)
+        new_set = set(tags)
+        for tag, start, end in old_set - new_set:
+            self.batch.tag_remove(tag, f"{line}.{start}", f"{line}.{end}")
+        for tag, start, end in new_set - old_set:
+            self.batch.tag_add(tag, f"{line}.{start}", f"{line}.{end}")
+        self.line_tags[row] = tags
+
+    def clamp_rows(self, first, last):
+        last = min(last, len(self.line_states) - 1)
+        return max(0, min(first, last)), last
+
+    def stale_start(self, first, last):
+        row = min(first, self.verified)
+        state = self.line_states[row]
+        line_count = len(self.line_states)
+        while row <= last and self.line_fresh[row] and self.line_states[row] == state:
+            if row + 1 < line_count:
+                state = self.line_states[row + 1] #Unchanged line with a matching checkpoint, skip it.
+            row += 1
+        return row, state
+
+    def apply_row(self, row, first, tags, state):
+        next_row = row + 1
+        if row >= first:
+            self.apply_tags(row, tags)
+            self.line_fresh[row] = True
+        else:
+            self.line_fresh[row] = False #Lexed only to carry the state towards the viewport.
+        if next_row < len(self.line_states) and self.line_states[next_row] != state:
+            self.line_states[next_row] = state
+            self.line_fresh[next_row] = False
+
+    def highlight_rows(self, first, last):
+        first, last = self.clamp_rows(first, last)
+        self.clear_unknown_lines(first, last)
+        row, state = self.stale_start(first, last)
+        while row <= last:
+            if self.line_fresh[row] and self.line_states[row] == state:
+                if row + 1 < len(self.line_states):
+                    state = self.line_states[row + 1]
+                row += 1
+                continue
+            tags, state = self.lexer.lex_line(self.document.line(row + 1), state)
+            self.apply_row(row, first, tags, state)
+            row += 1
+        self.batch.flush()
+        self.verified = max(self.verified, min(row, len(self.line_states) - 1))
+
+    def visible_rows(self):
+        if not self.viewport_only:
+            return 0, len(self.line_states) - 1
+        first_line = split_index(self.text_box.index("@0,0"))[0]
+        last_line = split_index(self.text_box.index(f"@0,{self.text_box.winfo_height()}"))[0]
+        return first_line - 1 - self.margin, last_line - 1 + self.margin
+
+    def refresh(self, delay=DEBOUNCE_MS):
+        if not self.enabled:
+            return
+        self.cancel_after("job_after_id")
+        self.job_after_id = self.text_box.after(delay, self.start_job)
+
+    def view_changed(self):
+        if self.enabled and self.job_after_id is None:
+            self.job_after_id = self.text_box.after(self.SCROLL_DELAY_MS, self.start_job)
+
+    def start_job(self):
+        self.job_after_id = None
+        first, last = self.clamp_rows(*self.visible_rows())
+        if self.worker is None:
+            self.highlight_rows(first, last)
+            return
+        start, state = self.stale_start(first, last)
+        if start > last:
+            return
+        lines = self.document.lines(start + 1, last + 1)
+        self.worker.submit((self.generation, start, first, lines, state))
+        if self.poll_after_id is None:
+            self.poll_after_id = self.text_box.after(self.POLL_MS, self.poll)
+
+    def poll(self):
+        self.poll_after_id = None
+        result = self.worker.latest_result()
+        if self.worker.pending:
+            self.poll_after_id = self.text_box.after(self.POLL_MS, self.poll)
+        if result is None:
+            return
+        generation, start, first, state, rows = result
+        if generation != self.generation or rows is None:
+            return #The buffer changed after the snapshot was taken, a newer job will follow.
+        self.cancel_after("apply_after_id")
+        self.clear_unknown_lines(first, start + len(rows) - 1)
+        if self.line_states[start] != state:
+            self.line_states[start] = state
+            self.line_fresh[start] = False
+        self.apply_slice(generation, start, first, rows, 0)
+
+    def apply_slice(self, generation, start, first, rows, offset):
+        self.apply_after_id = None
+        if generation != self.generation or not self.enabled:
+            return
+        end = min(offset + self.APPLY_SLICE, len(rows))
+        for index in range(offset, end):
+            tags, state = rows[index]
+            self.apply_row(start + index, first, tags, state)
+        self.batch.flush()
+        self.verified = max(self.verified, min(start + end, len(self.line_states) - 1))
+        if end < len(rows):
+            self.apply_after_id = self.text_box.after(1, self.apply_slice, generation, start, first, rows, end)
+
+    def cancel_after(self, attribute):
+        after_id = getattr(self, attribute)
+        if after_id is not None:
+            self.text_box.after_cancel(after_id)
+            setattr(self, attribute, None)
+
+    def cancel_jobs(self):
+        for attribute in ("job_after_id", "poll_after_id", "apply_after_id"):
+            self.cancel_after(attribute)
+
+    def close(self):
+        self.cancel_jobs()
+        if self.worker is not None:
+            self.worker.stop()
+
+class HighlightWorker:
+    CHECK_EVERY = 256
+
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.generation = 0
+        self.pending = 0
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, job):
+        self.pending += 1
+        self.jobs.put(job)
+
+    def latest_result(self):
+        result = None
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                return result
+            self.pending -= 1
+
+    def lex(self, generation, lines, state):
+        rows = []
+        lex_line = self.lexer.lex_line
+        for index, line in enumerate(lines):
+            if index % self.CHECK_EVERY == 0 and generation != self.generation:
+                return None #Stop lexing a snapshot that has already been edited.
+            tags, state = lex_line(line, state)
+            rows.append((tags, state))
+        return rows
+
+    def stop(self):
+        self.jobs.put(None)
+
+    def next_job(self):
+        job = self.jobs.get()
+        while job is not None and not self.jobs.empty():
+            generation, start, first, lines, state = job
+            self.results.put((generation, start, first, state, None)) #Superseded by a newer snapshot.
+            job = self.jobs.get()
+        return job
+
+    def run(self):
+        while True:
+            job = self.next_job()
+            if job is None:
+                return
+            generation, start, first, lines, state = job
+            rows = self.lex(generation, lines, state)
+            self.results.put((generation, start, first, state, rows))
+
+def search_process(requests, results, generation):
+    import mmap
+    text = ""
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+        if request[0] in ("text", "file"):
+            if isinstance(text, mmap.mmap):
+                text.close()
+            text = request[1]
+            if request[0] == "file":
+                with open(request[1], "rb") as file:
+                    text = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            continue
+        _, job, regex, flags = request
+        if isinstance(text, mmap.mmap):
+            regex = regex.encode("utf-8")
+            flags &= ~re.UNICODE
+        try:
+            pattern = re.compile(regex, flags)
+        except re.error:
+            results.put((job, None))
+            continue
+        chunk = []
+        chunk_size = SearchWorker.FIRST_CHUNK #Small at first so the first matches show up straight away.
+        for match in pattern.finditer(text):
+            chunk.append(match.span())
+            if len(chunk) >= chunk_size:
+                if generation.value != job:
+                    break #A newer search has replaced this one.
+                results.put((job, chunk))
+                chunk = []
+                chunk_size = min(chunk_size * 2, SearchWorker.MAX_CHUNK)
+        else:
+            results.put((job, chunk))
+            results.put((job, None))
+
+def line_matches(data, pattern, newline, limit):
+    #Works on str, bytes and mmap alike, counting newlines only between one match and the next.
+    matches = []
+    line = 1
+    line_start = 0
+    position = 0
+    for match in pattern.finditer(data):
+        start = match.start()
+        newlines = data[position:start].count(newline)
+        if newlines:
+            line += newlines
+            line_start = data.rfind(newline, position, start) + 1
+        position = start
+        line_end = data.find(newline, start)
+        if line_end == -1:
+            line_end = len(data)
+        matches.append((line, data[line_start:start], data[line_start:line_end]))
+        if len(matches) >= limit:
+            break
+    return matches
+
+def search_file(file_path, regex, flags):
+    limit = FindInFilesDialogue.MAX_FILE_MATCHES
+    try:
+        with open(file_path, "rb") as file:
+            head = file.read(FindInFilesDialogue.BINARY_SNIFF)
+            if b"\0" in head:
+                return [] #Binary file.
+            if os.fstat(file.fileno()).st_size < FindInFilesDialogue.MMAP_THRESHOLD:
+                text = (head + file.read()).decode("utf-8", "replace")
+                return [(file_path, line, len(prefix), line_text)
+                        for line, prefix, line_text in line_matches(text, re.compile(regex, flags), "\n", limit)]
+            import mmap
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                pattern = re.compile(regex.encode("utf-8"), flags & ~re.UNICODE)
+                return [(file_path, line, len(prefix.decode("utf-8", "replace")), line_text.decode("utf-8", "replace"))
+                        for line, prefix, line_text in line_matches(data, pattern, b"\n", limit)]
+    except (OSError, ValueError, BufferError, re.error):
+        return []
+
+def search_files(file_paths, regex, flags):
+    results = []
+    for file_path in file_paths:
+        results.extend(search_file(file_path, regex, flags))
+    return len(file_paths), results
+
+class SearchWorker:
+    FIRST_CHUNK = 100
+    MAX_CHUNK = 20000
+
+    def __init__(self):
+        import multiprocessing #Deferred, it is slow to import and only needed once a search starts.
+        self.process: Optional[multiprocessing.Process] = None
+        self.requests: Optional[multiprocessing.Queue] = None
+        self.results_queue: Optional[multiprocessing.Queue] = None
+        #Unlocked, terminate() can kill the worker mid-read and a held lock would then block the editor for good.
+        self.generation = multiprocessing.Value("i", 0, lock=False)
+        self.text_key = None
+
+    def start(self):
+        #Searching runs in its own process so a runaway pattern can be killed without freezing the editor.
+        import multiprocessing
+        self.requests = multiprocessing.Queue()
+        self.results_queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=search_process, daemon=True,
+                                               args=(self.requests, self.results_queue, self.generation))
+        self.process.start()
+        self.text_key = None
+
+    def next_job(self):
+        self.generation.value += 1 #Only the editor writes it, the worker just compares.
+        return self.generation.value
+
+    def search(self, document, pattern):
+        if self.process is None or not self.process.is_alive():
+            self.start()
+        text_key = (id(document), document.version)
+        if text_key != self.text_key:
+            self.requests.put(document.search_source())
+            self.text_key = text_key
+        job = self.next_job()
+        self.requests.put(("search", job, pattern.pattern, pattern.flags))
+        return job
+
+    def results(self, job):
+        chunks = []
+        while True:
+            try:
+                result_job, chunk = self.results_queue.get_nowait()
+            except (queue.Empty, OSError, ValueError):
+                return chunks
+            if result_job == job:
+                chunks.append(chunk)
+
+    def cancel(self):
+        self.next_job()
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.process = None
+
+class FindDialogue:
+    MATCH_TAG_LIMIT = 10000 #Selecting every hit of a common word in a huge file would stall Tk.
+    TYPE_DELAY_MS = 150
+    POLL_MS = 20
+    SEARCH_BUDGET = 10 #Seconds before a search is treated as a runaway pattern and stopped.
+    PATTERN_CACHE_SIZE = 64
+    pattern_cache = {}
+    search_worker: Optional[SearchWorker] = None
+
+    def __init__(self, text_box, document):
+        self.text_box = text_box
+        self.document = document
+        self.batch = TclBatch(text_box)
+        self.origin = document.index_to_offset(text_box.index("insert"))
+        self.find_window = self.setup_window()
+        self.window_frame = ttk.Frame(self.find_window, padding=(10,10,15,15))
+        find_frame = ttk.Frame(self.window_frame)
+        self.entry_frame = ttk.Frame(find_frame)
+        self.next_frame = ttk.Frame(find_frame)
+        self.dir_frame = ttk.Frame(find_frame)
+        self.direction_var = tk.StringVar()
+        self.user_input = tk.StringVar()
+        self.regex = ""
+        self.entry_text = ""
+        self.matches = []
+        self.match_key = None
+        self.count_var = tk.StringVar()
+        self.search_after_id: Optional[str] = None
+        self.poll_after_id: Optional[str] = None
+        self.search_job = 0
+        self.search_done = True
+        self.search_started = 0.0
+        self.pending_action = None
+        self.clicked_next = False
+        self.find_index = -1
+        self.cursor_index = 0
+        self.word_var = tk.IntVar(value=1)
+        self.regex_var = tk.IntVar(value=0)
+        self.wrap_var = tk.IntVar(value=1)
+        self.match_all_var = tk.IntVar(value=0)
+        self.create_dialogue()
+        self.user_input.trace_add("write", self.input_changed)
+        self.entry_frame.pack(fill="x", expand=True)
+        self.next_frame.pack(fill="x", expand=True)
+        self.dir_frame.pack(fill="x", expand=True)
+        find_frame.pack(fill="x")
+        self.window_frame.pack()
+
+    def setup_window(self):
+        find_window = tk.Toplevel()
+        find_window.transient(self.text_box.winfo_toplevel())
+        find_window.grab_set()
+        find_window.focus_force()
+        find_window.protocol("WM_DELETE_WINDOW", self.close)
+        find_window.title("Find")
+        return find_window
+
+    def create_options(self):
+        options_label = ttk.Label(self.next_frame, text="Options:")
+        options_label.pack(side="left", padx=(0, 10))
+        whole_word_radio = ttk.Checkbutton(self.next_frame, variable=self.word_var, text="Whole word", command=self.input_changed)
+        regex_radio = ttk.Checkbutton(self.next_frame, variable=self.regex_var, text="Regex", command=self.input_changed)
+        wrap_around_radio = ttk.Checkbutton(self.next_frame, variable=self.wrap_var, text="Wrap around")
+        match_all = ttk.Checkbutton(self.next_frame, text="Match all", variable=self.match_all_var, command=self.input_changed)
+        whole_word_radio.pack(side="left")
+        regex_radio.pack(side="left")
+        wrap_around_radio.pack(side="left")
+        match_all.pack(side="left")
+
+    def create_dialogue(self):
+        self.create_options()
+        self.create_find_label()
+        self.create_find_entry()
+        self.create_close_button()
+        self.create_direction_label()
+        self.create_radio_buttons()
+        self.create_count_label()
+        self.create_next_button()
+
+    def create_find_label(self):
+        find_label = ttk.Label(self.entry_frame, text="Find:", font=(font.nametofont("TkDefaultFont"), 10))
+        find_label.pack(side="left", padx=(0, 5))
+
+    def create_find_entry(self):
+        find_entry = ttk.Entry(self.entry_frame, width=55, textvariable=self.user_input)
+        find_entry.bind("<Return>", self.find)
+        find_entry.focus_set()
+        find_entry.pack(side="left", fill="x", expand=True)
+
+    def create_radio_buttons(self):
+        up_radio = ttk.Radiobutton(self.dir_frame, variable=self.direction_var, text="Up", value="Up")
+        down_radio = ttk.Radiobutton(self.dir_frame, variable=self.direction_var, text="Down", value="Down")
+        self.direction_var.set("Down")
+        up_radio.pack(side="left")
+        down_radio.pack(side="left")
+
+    def create_close_button(self):
+        close_button = ttk.Button(self.entry_frame, text="Close", command=self.close)
+        close_button.pack(side="right", anchor="e", padx=8)
+
+    def create_next_button(self):
+        next_button = ttk.Button(self.next_frame, text="Find Next", command=self.find)
+        next_button.pack(side="right", anchor="e",padx=(0, 8), pady=(5, 0))
+
+    def create_count_label(self):
+        cancel_button = ttk.Button(self.dir_frame, text="Cancel", command=self.cancel_search)
+        cancel_button.pack(side="right", anchor="e", padx=(0, 8))
+        count_label = ttk.Label(self.dir_frame, textvariable=self.count_var)
+        count_label.pack(side="right", padx=8)
+
+    def create_direction_label(self):
+        direction_label = ttk.Label(self.dir_frame, text="Direction:", font=(font.nametofont("TkDefaultFont"), 10))
+        direction_label.pack(side="left")
+
+    @staticmethod
+    def build_regex(input_text, whole_word, use_regex):
+        if use_regex:
+            return input_text
+        if whole_word:
+            words = input_text.split()
+            return r'\b' + r'\b\s+\b'.join(map(re.escape, words)) + r'\b'
+        return re.escape(input_text)
+
+    def compile_pattern(self, input_text):
+        key = (input_text, self.word_var.get(), self.regex_var.get())
+        pattern = FindDialogue.pattern_cache.get(key)
+        if pattern is None:
+            pattern = re.compile(self.build_regex(*key))
+            if len(FindDialogue.pattern_cache) >= self.PATTERN_CACHE_SIZE:
+                FindDialogue.pattern_cache.pop(next(iter(FindDialogue.pattern_cache)))
+            FindDialogue.pattern_cache[key] = pattern
+        return pattern
+
+    def find_matches(self):
+        input_text = self.user_input.get()
+        if input_text != self.entry_text:
+            self.find_index = -1
+            self.entry_text = input_text
+        try:
+            pattern = self.compile_pattern(input_text)
+        except re.error as error:
+            self.stop_search(f"Invalid regex: {error}")
+            return False
+        self.regex = pattern.pattern
+        match_key = (pattern, id(self.document), self.document.version)
+        if match_key == self.match_key: #Matches are reused until the pattern or the buffer changes.
+            return True
+        if FindDialogue.search_worker is None:
+            FindDialogue.search_worker = SearchWorker()
+        self.pending_action = None
+        self.matches = []
+        self.match_key = match_key
+        self.search_done = False
+        self.search_started = time.monotonic()
+        self.search_job = self.search_worker.search(self.document, pattern)
+        if self.poll_after_id is None:
+            self.poll_after_id = self.text_box.after(self.POLL_MS, self.poll_search)
+        return True
+
+    def poll_search(self):
+        self.poll_after_id = None
+        for chunk in self.search_worker.results(self.search_job):
+            if chunk is None:
+                self.search_done = True
+            else:
+                self.matches.extend(chunk)
+        if not self.search_done and time.monotonic() - self.search_started > self.SEARCH_BUDGET:
+            self.stop_search(f"Search stopped after {self.SEARCH_BUDGET} seconds")
+            return
+        self.run_pending_action()
+        self.update_count()
+        if not self.search_done:
+            self.poll_after_id = self.text_box.after(self.POLL_MS, self.poll_search)
+
+    def when_ready(self, action, ready=None, bell=True):
+        self.pending_action = (action, ready, bell)
+        self.run_pending_action()
+        self.update_count()
+
+    def run_pending_action(self):
+        if self.pending_action is None:
+            return
+        action, ready, bell = self.pending_action
+        if not self.search_done and not (ready and ready()):
+            return
+        self.pending_action = None
+        if self.matches:
+            action()
+        else:
+            self.clear_match_tags()
+            if bell:
+                self.text_box.bell()
+
+    def stop_search(self, message):
+        if not self.search_done and self.search_worker is not None:
+            self.search_worker.cancel() #Also stops a runaway pattern, which can't be interrupted any other way.
+        if self.poll_after_id is not None:
+            self.text_box.after_cancel(self.poll_after_id)
+            self.poll_after_id = None
+        self.pending_action = None
+        self.match_key = None
+        self.search_done = True
+        self.count_var.set(message)
+
+    def cancel_search(self, event=None):
+        if not self.search_done:
+            self.stop_search("Search cancelled")
+
+    def input_changed(self, *args):
+        self.cancel_type_delay()
+        self.search_after_id = self.text_box.after(self.TYPE_DELAY_MS, self.search_as_you_type)
+
+    def search_as_you_type(self):
+        self.search_after_id = None
+        if not self.user_input.get().strip():
+            self.stop_search("")
+            self.matches = []
+            self.clear_match_tags()
+            return
+        if not self.find_matches():
+            return
+        if self.match_all_var.get():
+            self.when_ready(self.select_all_matches, self.all_matches_ready, bell=False)
+        else:
+            self.when_ready(self.show_first_match, self.first_match_ready, bell=False)
+
+    def first_match(self):
+        first_match = bisect.bisect_left(self.matches, (self.origin,))
+        if self.direction_var.get() == "Up":
+            first_match -= 1
+        return first_match
+
+    def first_match_ready(self):
+        return 0 <= self.first_match() < len(self.matches) and self.matches[-1][0] >= self.origin
+
+    def show_first_match(self):
+        #Show the first match from where the cursor was when the dialogue opened.
+        self.find_index = self.first_match() % len(self.matches)
+        self.show_match()
+
+    def next_match_ready(self):
+        if self.match_all_var.get():
+            return self.all_matches_ready()
+        return self.direction_var.get() == "Down" and self.find_index + 1 < len(self.matches)
+
+    def all_matches_ready(self):
+        return len(self.matches) >= self.MATCH_TAG_LIMIT
+
+    def cancel_type_delay(self):
+        if self.search_after_id is not None:
+            self.text_box.after_cancel(self.search_after_id)
+            self.search_after_id = None
+
+    def find(self, event=None):
+        self.cancel_type_delay()
+        user_input = self.user_input.get()
+        if not user_input:
+             messagebox.showerror("Empty search error", "Error: invalid search. Try again...")
+             return
+        if not user_input.strip():
+             messagebox.showerror("Invalid search error", "Error: whitespace only searches not allowed. Try again...")
+             return
+        if self.find_matches():
+            self.when_ready(self.highlight_match, self.next_match_ready)
+
+    def update_count(self):
+        if self.match_key is None:
+            return
+        total = len(self.matches)
+        more = "" if self.search_done else "+"
+        if not total:
+            self.count_var.set("No matches" if self.search_done else "Searching...")
+        elif self.match_all_var.get() and total > self.MATCH_TAG_LIMIT:
+            self.count_var.set(f"{total}{more} matches, first {self.MATCH_TAG_LIMIT} selected")
+        elif not self.match_all_var.get() and 0 <= self.find_index < total:
+            self.count_var.set(f"{self.find_index + 1} of {total}{more}")
+        else:
+            self.count_var.set(f"{total}{more} matches")
+
+    def highlight_match(self):
+        if not self.match_all_var.get():
+            self.clicked_next = True
+            direction = self.direction_var.get()
+            if direction == "Up":
+                self.find_index -= 1
+            else:
+                self.find_index += 1
+            self.clamp_match_index(direction)
+            self.show_match()
+        else:
+            self.select_all_matches()
+
+    def show_match(self):
+        self.clicked_next = True
+        start, end = self.matches[self.find_index]
+        start_index = self.document.offset_to_index(start)
+        self.cursor_index = self.document.offset_to_index(end)
+        self.configure_tags(start_index)
+        self.text_box.see(start_index)
+
+    def clear_match_tags(self):
+        self.batch.tag_remove("fake_sel", "1.0", "end")
+        self.batch.tag_remove("sel", "1.0", "end")
+        self.batch.flush()
+
+    def select_all_matches(self):
+        self.batch.tag_remove("fake_sel", "1.0", "end")
+        self.batch.tag_remove("sel", "1.0", "end")
+        self.text_box.tag_configure("fake_sel", background="grey", foreground="white")
+        for start, end in self.matches[:self.MATCH_TAG_LIMIT]:
+            start_index = self.document.offset_to_index(start)
+            end_index = self.document.offset_to_index(end)
+            self.batch.tag_add("sel", start_index, end_index)
+            self.batch.tag_add("fake_sel", start_index, end_index)
+        self.batch.flush()
+
+    def clamp_match_index(self, direction):
+        wrap_around = self.wrap_var.get()
+        first_up_search = -2
+        if wrap_around and self.find_index != first_up_search:
+            self.find_index %= len(self.matches)
+        else:
+            last_match = len(self.matches)-1
+            if direction == "Up" and self.find_index < 0:
+                self.find_index = 0
+            elif direction == "Down" and self.find_index > last_match:
+                self.find_index = last_match
+
+    def configure_tags(self, start_index):
+        self.text_box.tag_remove("fake_sel", "1.0", "end")
+        self.text_box.tag_remove("sel", "1.0", "end")
+        self.text_box.tag_configure("fake_sel", background="grey", foreground="white")
+        self.text_box.tag_add("sel", start_index, self.cursor_index)
+        self.text_box.tag_add("fake_sel", start_index, self.cursor_index)
+
+    def close(self):
+        self.cancel_type_delay()
+        self.cancel_search()
+        if self.cursor_index != 0:
+            self.text_box.mark_set("insert", self.cursor_index)
+        self.find_window.destroy()
+
+class ReplaceDialogue(FindDialogue):
+    def __init__(self, text_box, document, undo_history):
+        FindDialogue.__init__(self,text_box,document)
+        self.undo_history = undo_history
+        self.find_window.title("Find And Replace")
+        replace_frame = ttk.Frame(self.window_frame)
+        replace_label = ttk.Label(replace_frame,text="Replace:",font=(font.nametofont("TkDefaultFont"), 10))
+        self.replace_input = tk.StringVar()
+        self.replace_entry = ttk.Entry(replace_frame,width=55,textvariable=self.replace_input)
+        self.replace_entry.bind("<Return>", self.replace)
+        replace_label.pack(side="left",padx=(0,5),fill="x", expand=True)
+        self.replace_entry.pack(side="left")
+        self.replace_button = ttk.Button(replace_frame,text="Replace", command=self.replace)
+        self.replace_button.pack(side="right",padx=8,anchor="e")
+        replace_frame.pack(pady=(10,0))
+
+    def replace(self, event=None):
+        user_input = self.replace_input.get()
+        is_space = any(char.isspace() for char in user_input)
+        if user_input == "":
+            messagebox.showerror("Empty replace error", "Error: must input valid text. Try again...")
+            return
+        if is_space:
+            messagebox.showerror("Whitespace error", "Error: cannot replace whitespace. Try again...")
+            return
+        if self.matches or self.match_all_var.get():
+            self.replace_matches(user_input)
+        else:
+            self.text_box.bell()
+
+    def replace_single_match(self, user_input):
+        start, end = self.matches[self.find_index]
+        start_index = self.document.offset_to_index(start)
+        end_index = self.document.offset_to_index(end)
+        self.undo_history.checkpoint()
+        self.text_box.replace(start_index, end_index, user_input)
+        self.undo_history.checkpoint()
+        self.find_matches()
+        self.find_index = -1
+        end_row, end_col = end_index.split(".")
+        end_col = int(end_col)
+        end_col -= (end - start) - len(user_input)
+        end_index = f"{end_row}.{end_col}"
+        self.cursor_index = end_index
+        self.clicked_next = False
+
+    def replace_all_matches(self, user_input):
+        matches = self.matches
+        text = self.document.text()
+        #The worker already found every match, so the pattern isn't run again on this thread.
+        parts = []
+        position = matches[0][0]
+        for start, end in matches:
+            parts.append(text[position:start])
+            parts.append(user_input)
+            position = end
+        count = len(matches)
+        #Only the text between the first and last match changed, so that is all that gets written back.
+        first_start = matches[0][0]
+        last_end = matches[-1][1]
+        changed_text = "".join(parts)
+        start_index = self.document.offset_to_index(first_start)
+        end_index = self.document.offset_to_index(last_end)
+        self.undo_history.checkpoint()
+        self.text_box.replace(start_index, end_index, changed_text)
+        self.undo_history.checkpoint()
+        self.matches = []
+        self.match_key = None
+        self.find_index = -1
+        self.clicked_next = False
+        self.count_var.set(f"Replaced {count} matches")
+
+    def replace_matches(self, user_input):
+        if not self.match_all_var.get():
+            if not self.clicked_next:
+                self.text_box.bell()
+                return
+            self.replace_single_match(user_input)
+        elif self.find_matches():
+            #Replace All needs every match, so it waits for the search to finish.
+            self.when_ready(lambda: self.replace_all_matches(user_input))
+
+class ViewerFindDialogue(FindDialogue):
+    def show_match(self):
+        self.clicked_next = True
+        start, end = self.matches[self.find_index]
+        start_index, self.cursor_index = self.document.span_to_indices(start, end)
+        self.configure_tags(start_index)
+        self.text_box.see(start_index)
+
+    def select_all_matches(self):
+        #Only the loaded page is in the widget, so only its matches can be selected.
+        viewer = self.document
+        first = bisect.bisect_left(self.matches, (viewer.page_start,))
+        last = bisect.bisect_left(self.matches, (viewer.page_end,))
+        self.batch.tag_remove("fake_sel", "1.0", "end")
+        self.batch.tag_remove("sel", "1.0", "end")
+        self.text_box.tag_configure("fake_sel", background="grey", foreground="white")
+        for start, end in self.matches[first:min(last, first + self.MATCH_TAG_LIMIT)]:
+            start_index = viewer.offset_to_index(start)
+            end_index = viewer.offset_to_index(min(end, viewer.page_end))
+            self.batch.tag_add("sel", start_index, end_index)
+            self.batch.tag_add("fake_sel", start_index, end_index)
+        self.batch.flush()
+
+class FindInFilesDialogue:
+    IGNORE_PATTERNS = ".git .hg .svn __pycache__ node_modules .venv venv *.pyc *.pyo *.so *.dll *.exe *.zip"
+    FILE_BATCH = 64 #Files handed to a pool worker at a time, enough to outweigh the pickling round trip.
+    MMAP_THRESHOLD = 1024 * 1024
+    BINARY_SNIFF = 8192
+    MAX_FILE_MATCHES = 200
+    MAX_RESULTS = 50000
+    POLL_MS = 50
+    pool = None
+
+    def __init__(self, text_editor):
+        self.text_editor = text_editor
+        self.window = tk.Toplevel()
+        self.window.transient(text_editor.window)
+        self.window.title("Find In Files")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self.user_input = tk.StringVar()
+        self.directory_var = tk.StringVar(value=os.path.dirname(text_editor.current_file_path or "") or os.getcwd())
+        self.ignore_var = tk.StringVar(value=FindInFilesDialogue.IGNORE_PATTERNS)
+        self.word_var = tk.IntVar(value=1)
+        self.regex_var = tk.IntVar(value=0)
+        self.status_var = tk.StringVar()
+        self.locations = []
+        self.futures = []
+        self.results: Optional[queue.Queue] = None
+        self.stop_event: Optional[threading.Event] = None
+        self.poll_after_id: Optional[str] = None
+        self.searched_files = 0
+        self.submitted_files: Optional[int] = None
+        self.match_count = 0
+        self.failed_files = 0
+        self.error: Optional[BaseException] = None
+        self.search_started = 0.0
+        self.result_list = self.create_dialogue()
+
+    def create_dialogue(self):
+        window_frame = ttk.Frame(self.window, padding=(10, 10, 10, 10))
+        entry_frame = ttk.Frame(window_frame)
+        ttk.Label(entry_frame, text="Find:").pack(side="left", padx=(0, 5))
+        find_entry = ttk.Entry(entry_frame, width=40, textvariable=self.user_input)
+        find_entry.bind("<Return>", self.search)
+        find_entry.focus_set()
+        find_entry.pack(side="left", fill="x", expand=True)
+        ttk.Button(entry_frame, text="Cancel", command=self.cancel).pack(side="right", padx=(8, 0))
+        ttk.Button(entry_frame, text="Search", command=self.search).pack(side="right", padx=(8, 0))
+        entry_frame.pack(fill="x")
+        directory_frame = ttk.Frame(window_frame)
+        ttk.Label(directory_frame, text="In:").pack(side="left", padx=(0, 5))
+        ttk.Entry(directory_frame, textvariable=self.directory_var).pack(side="left", fill="x", expand=True)
+        ttk.Button(directory_frame, text="Browse", command=self.browse).pack(side="right", padx=(8, 0))
+        directory_frame.pack(fill="x", pady=(5, 0))
+        ignore_frame = ttk.Frame(window_frame)
+        ttk.Label(ignore_frame, text="Ignore:").pack(side="left", padx=(0, 5))
+        ttk.Entry(ignore_frame, textvariable=self.ignore_var).pack(side="left", fill="x", expand=True)
+        ignore_frame.pack(fill="x", pady=(5, 0))
+        options_frame = ttk.Frame(window_frame)
+        ttk.Checkbutton(options_frame, variable=self.word_var, text="Whole word").pack(side="left")
+        ttk.Checkbutton(options_frame, variable=self.regex_var, text="Regex").pack(side="left")
+        ttk.Label(options_frame, textvariable=self.status_var).pack(side="right")
+        options_frame.pack(fill="x", pady=(5, 5))
+        list_frame = ttk.Frame(window_frame)
+        result_list = tk.Listbox(list_frame, width=100, height=20, activestyle="none")
+        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=result_list.yview)
+        result_list.config(yscrollcommand=scrollbar.set)
+        result_list.bind("<Double-Button-1>", self.open_result)
+        result_list.bind("<Return>", self.open_result)
+        scrollbar.pack(side="right", fill="y")
+        result_list.pack(side="left", fill="both", expand=True)
+        list_frame.pack(fill="both", expand=True)
+        window_frame.pack(fill="both", expand=True)
+        return result_list
+
+    def browse(self):
+        directory = filedialog.askdirectory(parent=self.window, initialdir=self.directory_var.get())
+        if directory:
+            self.directory_var.set(directory)
+
+    def search(self, event=None):
+        input_text = self.user_input.get()
+        directory = self.directory_var.get()
+        if not input_text.strip():
+            messagebox.showerror("Empty search error", "Error: invalid search. Try again...", parent=self.window)
+            return
+        if not os.path.isdir(directory):
+            messagebox.showerror("Directory error", f"{directory} is not a directory.", parent=self.window)
+            return
+        try:
+            pattern = re.compile(FindDialogue.build_regex(input_text, self.word_var.get(), self.regex_var.get()))
+        except re.error as error:
+            self.status_var.set(f"Invalid regex: {error}")
+            return
+        self.cancel()
+        if FindInFilesDialogue.pool is None:
+            import concurrent.futures #Deferred until the first search, like the pool itself.
+            FindInFilesDialogue.pool = concurrent.futures.ProcessPoolExecutor()
+        self.result_list.delete(0, tk.END)
+        self.locations = []
+        self.futures = []
+        self.results = queue.Queue()
+        self.stop_event = threading.Event()
+        self.searched_files = 0
+        self.submitted_files = None
+        self.match_count = 0
+        self.failed_files = 0
+        self.error = None
+        self.search_started = time.monotonic()
+        self.status_var.set("Searching...")
+        ignore_patterns = self.ignore_var.get().split()
+        walker = threading.Thread(target=self.walk, daemon=True,
+                                  args=(directory, ignore_patterns, pattern, self.results, self.stop_event))
+        walker.start()
+        self.poll_after_id = self.window.after(self.POLL_MS, self.poll)
+
+    @staticmethod
+    def ignored(name, ignore_patterns):
+        import fnmatch #Deferred until Find In Files walks a directory.
+        return any(fnmatch.fnmatch(name, ignore_pattern) for ignore_pattern in ignore_patterns)
+
+    def walk(self, directory, ignore_patterns, pattern, results, stop_event):
+        #Walking runs on its own thread so results from early batches stream in while the tree is still being listed.
+        submitted_files = 0
+        batch = []
+        try:
+            for root, directories, file_names in os.walk(directory):
+                if stop_event.is_set():
+                    return
+                directories[:] = [name for name in directories if not self.ignored(name, ignore_patterns)]
+                for file_name in file_names:
+                    if not self.ignored(file_name, ignore_patterns):
+                        batch.append(os.path.join(root, file_name))
+                    if len(batch) >= self.FILE_BATCH:
+                        if stop_event.is_set():
+                            return
+                        submitted_files += self.submit(batch, pattern, results)
+                        batch = []
+            if batch:
+                submitted_files += self.submit(batch, pattern, results)
+        except Exception as error: #A broken pool refuses new batches, the search ends with what was submitted.
+            results.put(error)
+        results.put(submitted_files)
+
+    def submit(self, batch, pattern, results):
+        future = self.pool.submit(search_files, batch, pattern.pattern, pattern.flags)
+        future.add_done_callback(lambda future: results.put((future, len(batch))))
+        self.futures.append(future)
+        return len(batch)
+
+    def poll(self):
+        self.poll_after_id = None
+        items = []
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(result, int):
+                self.submitted_files = result
+                continue
+            if isinstance(result, Exception):
+                self.search_failed(result)
+                continue
+            future, batch_size = result
+            if future.cancelled():
+                continue
+            if future.exception() is not None:
+                self.searched_files += batch_size #Finished, just without results, so the search can still end.
+                self.failed_files += batch_size
+                self.search_failed(future.exception())
+                continue
+            file_count, matches = future.result()
+            self.searched_files += file_count
+            for file_path, line, column, line_text in matches:
+                self.match_count += 1
+                if len(self.locations) < self.MAX_RESULTS:
+                    self.locations.append((file_path, line, column))
+                    relative_path = os.path.relpath(file_path, self.directory_var.get())
+                    items.append(f"{relative_path}:{line}: {line_text.strip()[:200]}")
+        if items:
+            self.result_list.insert(tk.END, *items)
+        elapsed = time.monotonic() - self.search_started
+        if self.submitted_files is not None and self.searched_files >= self.submitted_files:
+            status = f"{self.match_count} matches, {self.searched_files - self.failed_files} files searched in {elapsed:.1f}s"
+            if self.error is not None:
+                status += f", stopped early: {self.error!r}"
+            self.status_var.set(status)
+            return
+        self.status_var.set(f"{self.match_count} matches, {self.searched_files} files searched...")
+        self.poll_after_id = self.window.after(self.POLL_MS, self.poll)
+
+    def search_failed(self, error):
+        import concurrent.futures
+        if self.error is None:
+            self.error = error
+        if isinstance(error, concurrent.futures.BrokenExecutor) and FindInFilesDialogue.pool is not None:
+            FindInFilesDialogue.pool = None #A worker died, the next search starts a fresh pool.
+            self.stop_event.set()
+
+    def cancel(self):
+        if self.stop_event is not None:
+            self.stop_event.set()
+        for future in self.futures:
+            future.cancel()
+        if self.poll_after_id is not None:
+            self.window.after_cancel(self.poll_after_id)
+            self.poll_after_id = None
+            self.status_var.set(f"Search cancelled, {self.match_count} matches so far")
+
+    def open_result(self, event=None):
+        selection = self.result_list.curselection()
+        if selection and selection[0] < len(self.locations):
+            file_path, line, column = self.locations[selection[0]]
+            self.text_editor.open_file_at(file_path, f"{line}.{column}")
+
+    def close(self):
+        self.cancel()
+        self.window.destroy()
+
+def index_symbols(text):
+    import ast #Runs in the indexing process, the editor itself never imports it.
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None #Code being edited often doesn't parse, the last good index is kept.
+    symbols = []
+    blocks = (ast.If, ast.Try, ast.ExceptHandler, ast.With, ast.For, ast.While)
+    lines = text.split("\n")
+
+    def column(node):
+        #col_offset counts UTF-8 bytes, Tk indices count characters.
+        line = lines[node.lineno - 1]
+        if line.isascii():
+            return node.col_offset
+        return len(line.encode()[:node.col_offset].decode("utf-8", "replace"))
+
+    def visit(node, scope, in_function):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                kind = "class" if isinstance(child, ast.ClassDef) else "function"
+                symbols.append((child.name, kind, child.lineno, column(child), len(scope)))
+                visit(child, scope + [child.name], kind == "function")
+            elif isinstance(child, (ast.Assign, ast.AnnAssign)) and not in_function:
+                targets = child.targets if isinstance(child, ast.Assign) else [child.target]
+                for target in targets:
+                    for name in ast.walk(target):
+                        if isinstance(name, ast.Name):
+                            symbols.append((name.id, "variable", name.lineno, column(name), len(scope)))
+            elif isinstance(child, blocks):
+                visit(child, scope, in_function)
+
+    visit(tree, [], False)
+    return symbols
+
+def index_directory(directory, known, limit, max_bytes):
+    #Parses the directory's Python files that changed since they were last indexed.
+    present = []
+    results = []
+    try:
+        entries = sorted((entry for entry in os.scandir(directory) if entry.name.endswith(".py") and entry.is_file()),
+                         key=lambda entry: entry.name)
+    except OSError:
+        return present, results
+    for entry in entries[:limit]:
+        try:
+            stat = entry.stat()
+            present.append(entry.path)
+            if known.get(entry.path) == stat.st_mtime or stat.st_size > max_bytes:
+                continue
+            with open(entry.path, "rb") as file:
+                text = file.read().decode("utf-8", "replace")
+        except OSError:
+            continue
+        results.append((entry.path, stat.st_mtime, index_symbols(text) or []))
+    return present, results
+
+class SymbolIndex:
+    DELAY_MS = 400 #Quiet time after an edit before the buffer is parsed again.
+    POLL_MS = 50
+    MAX_CHARS = 8 * 1024 * 1024
+    pool = None
+
+    def __init__(self, text_box, document, on_update):
+        self.text_box = text_box
+        self.document = document
+        self.on_update = on_update
+        self.enabled = False
+        self.symbols = []
+        self.definitions = {}
+        self.future = None
+        self.after_id: Optional[str] = None
+        self.poll_after_id: Optional[str] = None
+
+    @staticmethod
+    def submit(function, *args):
+        if SymbolIndex.pool is None:
+            import concurrent.futures #Deferred like Find In Files' pool, one process parses for every tab.
+            SymbolIndex.pool = concurrent.futures.ProcessPoolExecutor(max_workers=1)
+        return SymbolIndex.pool.submit(function, *args)
+
+    def set_enabled(self, enabled):
+        if enabled == self.enabled:
+            return
+        self.enabled = enabled
+        if enabled:
+            self.schedule(0)
+        else:
+            self.cancel()
+            self.symbols = []
+            self.definitions = {}
+            self.on_update(self)
+
+    def text_edited(self, operation, start, end, text):
+        if self.enabled:
+            self.schedule(self.DELAY_MS)
+
+    def schedule(self, delay):
+        if self.after_id is not None:
+            self.text_box.after_cancel(self.after_id)
+        self.after_id = self.text_box.after(delay, self.start)
+
+    def start(self):
+        self.after_id = None
+        if self.future is not None:
+            self.schedule(self.DELAY_MS) #The previous parse is still running, go again once it is done.
+            return
+        if len(self.document) > self.MAX_CHARS:
+            return
+        self.future = self.submit(index_symbols, self.document.text())
+        self.poll_after_id = self.text_box.after(self.POLL_MS, self.poll)
+
+    def poll(self):
+        self.poll_after_id = None
+        if not self.future.done():
+            self.poll_after_id = self.text_box.after(self.POLL_MS, self.poll)
+            return
+        future = self.future
+        self.future = None
+        try:
+            symbols = future.result()
+        except Exception:
+            SymbolIndex.pool = None #A broken pool is replaced on the next parse.
+            return
+        if symbols is None or symbols == self.symbols:
+            return
+        self.symbols = symbols
+        definitions = {}
+        for symbol in sorted(symbols, key=lambda symbol: symbol[1] == "variable"): #Classes and functions win over assignments.
+            definitions.setdefault(symbol[0], symbol)
+        self.definitions = definitions
+        self.on_update(self)
+
+    def cancel(self):
+        for attribute in ("after_id", "poll_after_id"):
+            after_id = getattr(self, attribute)
+            if after_id is not None:
+                self.text_box.after_cancel(after_id)
+                setattr(self, attribute, None)
+        self.future = None
+
+class CompletionIndex:
+    IDENTIFIER = re.compile(r"\b[^\W\d]\w+")
+    WORD_TAIL = re.compile(r"\w+$")
+    WORD_HEAD = re.compile(r"\w*")
+    TAIL_CHARS = 256 #How far back an edit looks for the start of the word it touched.
+    SCAN_LIMIT = 2000 #Words with the prefix looked at per lookup, keeps short prefixes fast.
+    BULK_WORDS = 64
+    COUNT_CHARS = 1024 * 1024
+    POLL_MS = 20
+
+    def __init__(self, text_box, document):
+        self.text_box = text_box
+        self.document = document
+        self.enabled = False
+        self.counts = {}
+        self.words = [] #Sorted, buffer words and the fixed Python names, for bisect prefix lookups.
+        self.static = set()
+        self.pending: Optional[list] = None #Edits made while the first count runs.
+        self.after_id: Optional[str] = None
+
+    def set_enabled(self, enabled):
+        if enabled == self.enabled:
+            return
+        self.enabled = enabled
+        self.cancel()
+        self.counts = {}
+        if not enabled:
+            self.words = []
+            return
+        TextEditor.load_name_tables()
+        self.static = set(keyword.kwlist) | TextEditor.BUILTINS | TextEditor.DUNDERS
+        self.words = sorted(self.static)
+        #The first count runs on a thread, edits made meanwhile are replayed on top of it.
+        self.pending = []
+        result = {}
+        threading.Thread(target=self.count_words, args=(self.document.text(), result), daemon=True).start()
+        self.after_id = self.text_box.after(self.POLL_MS, self.poll_count, result)
+
+    def count_words(self, text, result):
+        counts = Counter()
+        start = 0
+        while start < len(text):
+            end = text.find("\n", start + self.COUNT_CHARS) + 1 or len(text) #Slices end on whole lines.
+            counts.update(self.IDENTIFIER.findall(text, start, end))
+            start = end
+        result["counts"] = counts
+
+    def poll_count(self, result):
+        if "counts" not in result:
+            self.after_id = self.text_box.after(self.POLL_MS, self.poll_count, result)
+            return
+        self.after_id = None
+        self.counts = dict(result["counts"])
+        self.words = sorted(self.static.union(self.counts))
+        pending = self.pending
+        self.pending = None
+        for old_words, new_words in pending:
+            self.update(old_words, new_words)
+
+    def text_edited(self, operation, start, end, text):
+        if not self.enabled:
+            return
+        #Only the words touching the edit change, the rest of the line is left alone.
+        line_number, column = split_index(start)
+        line = self.document.line(line_number)
+        tail = self.WORD_TAIL.search(line, max(0, column - self.TAIL_CHARS), column)
+        left = tail.group() if tail else ""
+        if operation == "insert":
+            end_line, end_column = split_index(end)
+            right = self.WORD_HEAD.match(self.document.line(end_line), end_column).group()
+            old_words, new_words = self.IDENTIFIER.findall(left + right), self.IDENTIFIER.findall(left + text + right)
+        else:
+            right = self.WORD_HEAD.match(line, column).group()
+            old_words, new_words = self.IDENTIFIER.findall(left + text + right), self.IDENTIFIER.findall(left + right)
+        if self.pending is not None:
+            self.pending.append((old_words, new_words))
+        else:
+            self.update(old_words, new_words)
+
+    def update(self, old_words, new_words):
+        removed = []
+        for word in old_words:
+            count = self.counts.get(word)
+            if count is None:
+                continue
+            if count > 1:
+                self.counts[word] = count - 1
+            else:
+                del self.counts[word]
+                if word not in self.static:
+                    removed.append(word)
+        added = []
+        for word in new_words:
+            count = self.counts.get(word, 0)
+            self.counts[word] = count + 1
+            if not count and word not in self.static:
+                added.append(word)
+        if len(removed) + len(added) > self.BULK_WORDS:
+            self.words = sorted(self.static.union(self.counts)) #Cheaper than many single inserts on a big paste or load.
+            return
+        for word in removed:
+            position = bisect.bisect_left(self.words, word)
+            if position < len(self.words) and self.words[position] == word and word not in self.counts:
+                del self.words[position]
+        for word in added:
+            position = bisect.bisect_left(self.words, word)
+            if position == len(self.words) or self.words[position] != word:
+                self.words.insert(position, word)
+
+    def complete(self, prefix, limit):
+        position = bisect.bisect_left(self.words, prefix)
+        candidates = []
+        for word in self.words[position:position + self.SCAN_LIMIT]:
+            if not word.startswith(prefix):
+                break
+            if word != prefix:
+                candidates.append(word)
+        #Most used in the buffer first, shorter words break ties.
+        import heapq #Deferred until completion is first asked for.
+        return heapq.nsmallest(limit, candidates, key=lambda word: (-self.counts.get(word, 0), len(word), word))
+
+    def cancel(self):
+        if self.after_id is not None:
+            self.text_box.after_cancel(self.after_id)
+            self.after_id = None
+        self.pending = None
+
+class CompletionPopup:
+    LIMIT = 10
+
+    def __init__(self, text_box, completions):
+        self.text_box = text_box
+        self.completions = completions
+        self.window: Optional[tk.Toplevel] = None
+        self.listbox: Optional[tk.Listbox] = None
+        self.start: Optional[str] = None
+
+    def is_open(self):
+        return self.window is not None
+
+    def open(self, event=None):
+        if not self.completions.enabled:
+            return None
+        tail = CompletionIndex.WORD_TAIL.search(self.text_box.get("insert linestart", "insert"))
+        if tail is None:
+            self.text_box.bell()
+            return "break"
+        self.start = self.text_box.index(f"insert-{len(tail.group())}c")
+        self.refresh()
+        if not self.is_open():
+            self.text_box.bell()
+        return "break"
+
+    def prefix(self):
+        if self.text_box.compare("insert", "<=", self.start) or self.text_box.compare("insert", ">", f"{self.start} lineend"):
+            return None
+        prefix = self.text_box.get(self.start, "insert")
+        return prefix if prefix.isidentifier() else None
+
+    def refresh(self):
+        if self.start is None:
+            return
+        prefix = self.prefix()
+        candidates = self.completions.complete(prefix, self.LIMIT) if prefix else []
+        if not candidates:
+            self.close()
+            return
+        if self.window is None:
+            self.create_window()
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *candidates)
+        self.listbox.config(height=len(candidates))
+        self.listbox.selection_set(0)
+        bbox = self.text_box.bbox("insert")
+        if bbox is not None:
+            x, y, _, height = bbox
+            self.window.geometry(f"+{self.text_box.winfo_rootx() + x}+{self.text_box.winfo_rooty() + y + height}")
+
+    def create_window(self):
+        self.window = tk.Toplevel(self.text_box)
+        self.window.overrideredirect(True) #No title bar, the popup sits under the cursor.
+        self.listbox = tk.Listbox(self.window, exportselection=False, activestyle="none", font=self.text_box.cget("font"),
+                                  background=self.text_box.cget("background"), foreground=self.text_box.cget("foreground"))
+        self.listbox.bind("<ButtonRelease-1>", self.accept)
+        self.listbox.pack(fill="both", expand=True)
+
+    def move(self, step):
+        if not self.is_open():
+            return None
+        selection = self.listbox.curselection()
+        index = max(0, min(self.listbox.size() - 1, (selection[0] if selection else 0) + step))
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(index)
+        self.listbox.see(index)
+        return "break"
+
+    def accept(self, event=None):
+        if not self.is_open():
+            return None
+        selection = self.listbox.curselection()
+        prefix = self.prefix()
+        if selection and prefix is not None:
+            self.text_box.insert("insert", self.listbox.get(selection[0])[len(prefix):])
+        self.close()
+        self.text_box.focus_set()
+        return "break"
+
+    def close(self, event=None):
+        if not self.is_open():
+            return None
+        self.window.destroy()
+        self.window = None
+        self.listbox = None
+        self.start = None
+        return "break"
+
+class ViewMargins:
+    GUTTER_PADDING = 6
+    MINIMAP_WIDTH = 80
+    MINIMAP_COLUMNS = 100 #Characters that fill the minimap's width, longer lines are cut off.
+    ROW_PIXELS = 2
+    ROW_SAMPLES = 8 #Lines looked at per minimap row, so a summary costs the same for any document size.
+
+    def __init__(self, parent, text_box, document, highlighter):
+        self.text_box = text_box
+        self.document = document
+        self.highlighter = highlighter
+        self.enabled = True
+        self.colours = {"background": "white", "foreground": "grey", "view": "#d0d0d0"}
+        self.tag_colours = {}
+        self.gutter = tk.Canvas(parent, width=0, highlightthickness=0, borderwidth=0)
+        self.gutter.pack(side="left", fill="y", before=text_box)
+        self.minimap = tk.Canvas(parent, width=self.MINIMAP_WIDTH, highlightthickness=0, borderwidth=0)
+        self.minimap.pack(side="right", fill="y", before=text_box)
+        self.gutter_items = []
+        self.gutter_key = None
+        self.gutter_font: Optional[font.Font] = None
+        #Cached minimap summary: one (indent, length, tag) per row, rebuilt only when lines are added or removed.
+        self.rows = []
+        self.row_items = []
+        self.lines_per_row = 1
+        self.stale = True
+        self.dirty_rows = set()
+        self.view_item: Optional[int] = None
+        self.drawn_at = 0.0
+        self.after_id: Optional[str] = None
+        text_box.bind("<Configure>", self.request, add="+")
+        self.minimap.bind("<Configure>", self.resized)
+        self.minimap.bind("<Button-1>", self.minimap_clicked)
+        self.minimap.bind("<B1-Motion>", self.minimap_clicked)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.stale = True
+        self.request()
+
+    def set_colours(self, colours, tag_colours):
+        self.colours = colours
+        self.tag_colours = tag_colours
+        self.gutter.config(background=colours["background"])
+        self.minimap.config(background=colours["background"])
+        self.gutter_key = None
+        self.stale = True
+        self.request()
+
+    def text_edited(self, operation, start, end, text):
+        if "\n" in text:
+            self.stale = True #Lines moved between rows.
+        elif not self.stale:
+            self.dirty_rows.add((split_index(start)[0] - 1) // self.lines_per_row)
+        self.request()
+
+    def resized(self, event=None):
+        self.stale = True
+        self.request()
+
+    def request(self, event=None):
+        #At most one redraw per frame, however many scroll, resize and edit events arrive.
+        if self.after_id is not None:
+            return
+        delay = int((self.drawn_at - time.perf_counter()) * 1000) + Instrumentation.FRAME_MS
+        if delay > 0:
+            self.after_id = self.text_box.after(delay, self.draw)
+        else:
+            self.after_id = self.text_box.after_idle(self.draw)
+
+    def draw(self):
+        self.after_id = None
+        self.drawn_at = time.perf_counter()
+        if not self.enabled:
+            self.gutter.delete("all")
+            self.minimap.delete("all")
+            self.gutter_items = []
+            self.row_items = []
+            self.view_item = None
+            self.gutter.config(width=0)
+            return
+        self.draw_gutter()
+        self.draw_minimap()
+
+    def draw_gutter(self):
+        line_count = self.document.line_count()
+        text_font = self.text_box.cget("font")
+        key = (str(text_font), len(str(line_count)))
+        if key != self.gutter_key:
+            self.gutter_key = key
+            self.gutter_font = font.Font(font=text_font)
+            width = self.gutter_font.measure("0" * max(key[1], 2)) + 2 * self.GUTTER_PADDING
+            self.gutter.config(width=width)
+            self.gutter.delete("all")
+            self.gutter_items = []
+        x = int(self.gutter.cget("width")) - self.GUTTER_PADDING
+        #Only lines on screen are drawn, dlineinfo is None for the rest.
+        line = split_index(self.text_box.index("@0,0"))[0]
+        count = 0
+        while line <= line_count:
+            info = self.text_box.dlineinfo(f"{line}.0")
+            if info is None:
+                if count:
+                    break
+                line += 1 #The top line started above the view.
+                continue
+            if count == len(self.gutter_items):
+                self.gutter_items.append(self.gutter.create_text(0, 0, anchor="ne", font=self.gutter_font))
+            item = self.gutter_items[count]
+            self.gutter.coords(item, x, info[1])
+            self.gutter.itemconfig(item, text=str(line), fill=self.colours["foreground"], state="normal")
+            count += 1
+            line += 1
+        for item in self.gutter_items[count:]:
+            self.gutter.itemconfig(item, state="hidden")
+
+    def draw_minimap(self):
+        if self.stale:
+            self.build_summary()
+        elif self.dirty_rows:
+            dirty_rows = self.dirty_rows
+            self.dirty_rows = set()
+            for row in dirty_rows:
+                if row < len(self.rows):
+                    self.summarise(row)
+                    self.draw_row(row)
+        first, last = self.text_box.yview()
+        height = len(self.rows) * self.ROW_PIXELS
+        self.minimap.coords(self.view_item, 0, first * height, self.MINIMAP_WIDTH, max(last * height, first * height + 2))
+
+    def build_summary(self):
+        self.stale = False
+        self.dirty_rows = set()
+        line_count = self.document.line_count()
+        row_count = max(1, self.minimap.winfo_height() // self.ROW_PIXELS)
+        self.lines_per_row = -(-line_count // row_count)
+        self.rows = [None] * -(-line_count // self.lines_per_row)
+        self.minimap.delete("all")
+        self.view_item = self.minimap.create_rectangle(0, 0, 0, 0, fill=self.colours["view"], width=0)
+        self.row_items = []
+        for row in range(len(self.rows)):
+            self.summarise(row)
+            self.row_items.append(self.minimap.create_rectangle(0, 0, 0, 0, width=0))
+            self.draw_row(row)
+
+    def summarise(self, row):
+        first = row * self.lines_per_row + 1
+        last = min(first + self.lines_per_row, self.document.line_count() + 1)
+        longest, longest_line = "", first
+        for line_number in range(first, last, max(1, (last - first) // self.ROW_SAMPLES)):
+            line = self.document.line(line_number)
+            if len(line.rstrip()) > len(longest):
+                longest, longest_line = line.rstrip(), line_number
+        tag = None
+        line_tags = self.highlighter.line_tags
+        if longest and longest_line <= len(line_tags):
+            tags = line_tags[longest_line - 1]
+            if tags is None:
+                self.dirty_rows.add(row) #Not highlighted yet, looked at again on a later redraw.
+            elif tags:
+                tag = max(tags, key=lambda tag: tag[2] - tag[1])[0]
+        self.rows[row] = (len(longest) - len(longest.lstrip()), len(longest), tag)
+
+    def draw_row(self, row):
+        indent, length, tag = self.rows[row]
+        scale = self.MINIMAP_WIDTH / self.MINIMAP_COLUMNS
+        y = row * self.ROW_PIXELS
+        self.minimap.coords(self.row_items[row], min(indent, self.MINIMAP_COLUMNS) * scale, y,
+                            min(length, self.MINIMAP_COLUMNS) * scale, y + self.ROW_PIXELS - 1)
+        self.minimap.itemconfig(self.row_items[row], fill=self.tag_colours.get(tag, self.colours["foreground"]))
+
+    def minimap_clicked(self, event):
+        if not self.rows:
+            return
+        first, last = self.text_box.yview()
+        self.text_box.yview_moveto(event.y / (len(self.rows) * self.ROW_PIXELS) - (last - first) / 2)
+
+    def cancel(self):
+        if self.after_id is not None:
+            self.text_box.after_cancel(self.after_id)
+            self.after_id = None
+
+class FileWatcher:
+    POLL_MS = 1000
+    STAT_BATCH = 64 #Files stat'ed per tick without inotify, so many open files never add up to a long pause.
+    #IN_ATTRIB, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE and IN_DELETE on the file's directory.
+    EVENTS = 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+
+    def __init__(self, widget, on_change):
+        self.widget = widget
+        self.on_change = on_change
+        self.signatures = {}
+        self.polled = deque() #Files no directory watch covers, stat'ed in turn.
+        self.suspects = set()
+        self.watches = {}
+        self.directories = {}
+        self.libc = None
+        self.inotify: Optional[int] = self.open_inotify()
+        self.after_id: Optional[str] = None
+
+    def open_inotify(self):
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            import ctypes #Deferred, inotify is only there on Linux, everywhere else the files are stat'ed.
+            libc = ctypes.CDLL(None, use_errno=True)
+            descriptor = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if descriptor < 0:
+            return None
+        self.libc = libc
+        return descriptor
+
+    @staticmethod
+    def signature(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def sync(self, paths):
+        paths = {os.path.abspath(path) for path in paths}
+        for path in [path for path in self.signatures if path not in paths]:
+            self.unwatch(path)
+        for path in paths - self.signatures.keys():
+            self.watch(path)
+
+    def watch(self, path):
+        self.signatures[path] = self.signature(path)
+        directory = os.path.dirname(path)
+        if directory not in self.directories and self.inotify is not None:
+            watch = self.libc.inotify_add_watch(self.inotify, os.fsencode(directory), self.EVENTS)
+            if watch >= 0: #Out of watches or no permission, the file is polled instead.
+                self.watches[watch] = directory
+                self.directories[directory] = watch
+        if directory not in self.directories:
+            self.polled.append(path)
+        if self.after_id is None:
+            self.after_id = self.widget.after(self.POLL_MS, self.tick)
+
+    def unwatch(self, path):
+        del self.signatures[path]
+        self.suspects.discard(path)
+        if path in self.polled:
+            self.polled.remove(path)
+        directory = os.path.dirname(path)
+        if directory in self.directories and not any(os.path.dirname(other) == directory for other in self.signatures):
+            watch = self.directories.pop(directory)
+            del self.watches[watch]
+            self.libc.inotify_rm_watch(self.inotify, watch)
+
+    def update(self, path):
+        path = os.path.abspath(path)
+        if path in self.signatures:
+            self.signatures[path] = self.signature(path) #Our own save, not a change to report.
+
+    def read_events(self):
+        try:
+            data = os.read(self.inotify, 64 * 1024)
+        except BlockingIOError:
+            return
+        import struct #Deferred like ctypes, inotify is only read on Linux.
+        offset = 0
+        while offset < len(data):
+            watch, mask, cookie, length = struct.unpack_from("iIII", data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip(b"\0")
+            offset += 16 + length
+            if mask & self.IN_Q_OVERFLOW:
+                self.suspects.update(self.signatures) #Events were dropped, check everything once.
+            directory = self.watches.get(watch)
+            if directory is None:
+                continue
+            if mask & self.IN_IGNORED: #The directory itself went away, its files fall back to polling.
+                del self.watches[watch]
+                del self.directories[directory]
+                self.polled.extend(path for path in self.signatures if os.path.dirname(path) == directory)
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if path in self.signatures:
+                self.suspects.add(path)
+
+    def tick(self):
+        self.after_id = None
+        if not self.signatures:
+            return
+        if self.inotify is not None:
+            self.read_events() #One non-blocking read, however many files are open.
+        for _ in range(min(self.STAT_BATCH, len(self.polled))):
+            self.suspects.add(self.polled[0])
+            self.polled.rotate(-1)
+        suspects = self.suspects
+        self.suspects = set()
+        changed = []
+        for path in suspects:
+            signature = self.signature(path)
+            if path in self.signatures and signature != self.signatures[path]:
+                self.signatures[path] = signature
+                changed.append(path)
+        #Scheduled before reporting, so a watch added by on_change never starts a second tick chain.
+        self.after_id = self.widget.after(self.POLL_MS, self.tick)
+        for path in changed:
+            if path in self.signatures:
+                self.on_change(path)
+
+    def close(self):
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+        if self.inotify is not None:
+            os.close(self.inotify)
+            self.inotify = None
+
+class UpdateScheduler:
+    #Handlers mark work as dirty, it then runs once per idle cycle however many events asked for it.
+    def __init__(self, widget):
+        self.widget = widget
+        self.tasks = {}
+        self.dirty = {}
+        self.after_id: Optional[str] = None
+
+    def add_task(self, name, priority, callback):
+        self.tasks[name] = (priority, callback)
+
+    def mark(self, name, *args):
+        self.dirty[(name, args)] = self.tasks[name][0]
+        if self.after_id is None:
+            self.after_id = self.widget.after_idle(self.run)
+
+    def forget(self, argument):
+        for key in [key for key in self.dirty if argument in key[1]]:
+            del self.dirty[key]
+
+    def run(self):
+        self.after_id = None
+        dirty = self.dirty
+        self.dirty = {}
+        for (name, args), _ in sorted(dirty.items(), key=lambda item: item[1]):
+            self.tasks[name][1](*args)
+
+class TimedCallWrapper(tk.CallWrapper):
+    #Every Tcl to Python callback goes through this, bindings, menu and button commands and after() alike.
+    instrumentation: Optional["Instrumentation"] = None
+
+    def __call__(self, *args):
+        start = time.perf_counter()
+        batch_calls = TclBatch.total_calls
+        try:
+            return super().__call__(*args)
+        finally:
+            instrumentation = self.instrumentation
+            #The wrapper is module wide, callbacks of any other Tk app in the process aren't recorded.
+            if instrumentation is not None and self.widget._root() is instrumentation.window:
+                instrumentation.record(self.func, time.perf_counter() - start, TclBatch.total_calls - batch_calls)
+
+class Instrumentation:
+    HISTORY = 1000 #Most recent timings kept per handler for the rolling histogram.
+    BUCKETS_MS = (1, 2, 4, 8, 16, 33, 66, 133, 266, 533, 1000)
+    FRAME_MS = 16
+    FRAME_REPORT_MS = 1000
+
+    def __init__(self):
+        self.handlers = {}
+        self.frame_times = deque(maxlen=self.FRAME_REPORT_MS // self.FRAME_MS)
+        self.last_tick = 0.0
+        self.last_report = 0.0
+        self.frame_label: Optional[ttk.Label] = None
+        self.window: Optional[tk.Tk] = None
+        self.profiler = None
+        self.profile_started = 0.0
+
+    def install(self):
+        TimedCallWrapper.instrumentation = self
+        tk.CallWrapper = TimedCallWrapper #Only callbacks registered from here on are timed.
 
-    def find_matches(self):
-        input_text = self.user_input.get()
-        if input_text != self.entry_text:
-            self.find_index = -1
-            self.entry_text = input_text
-        if self.word_var.get():
-            words = input_text.split()
-            self.regex = r'\b' + r'\b\s+\b'.join(map(re.escape, words)) + r'\b'
-        else:
-           self.regex = re.escape(input_text)
-        matches = list(re.finditer(self.regex, self.text_box.get("1.0", "end-1c")))
-        return matches
+    def uninstall(self):
+        TimedCallWrapper.instrumentation = None
+        if tk.CallWrapper is TimedCallWrapper:
+            tk.CallWrapper = TimedCallWrapper.__bases__[0]
 
-    def find(self, event=None):
-        user_input = self.user_input.get()
-        if not user_input:
-             messagebox.showerror("Empty search error", "Error: invalid search. Try again...")
-             return
-        if not user_input.strip():
-             messagebox.showerror("Invalid search error", "Error: whitespace only searches not allowed. Try again...")
-             return
-        self.matches = self.find_matches()
-        if self.matches:
-            self.highlight_match()
-        else:
-            self.text_box.bell()
+    def start_frame_meter(self, window, frame_label):
+        self.window = window
+        self.frame_label = frame_label
+        #The ticker is a plain Tcl command so it doesn't show up in the handler timings itself.
+        window.tk.createcommand("::texteditor_frame_tick", self.frame_tick)
+        self.last_tick = self.last_report = time.perf_counter()
+        window.tk.call("after", self.FRAME_MS, "::texteditor_frame_tick")
 
-    def highlight_match(self):
-        if not self.match_all_var.get():
-            self.clicked_next = True
-            direction = self.direction_var.get()
-            if direction == "Up":
-                self.find_index -= 1
-            else:
-                self.find_index += 1
-            self.clamp_match_index(direction)
-            current_match = self.matches[self.find_index]
-            start_index = self.text_box.index(f"1.0 + {current_match.start()} chars")
-            self.cursor_index = self.text_box.index(f"1.0 + {current_match.end()} chars")
-            self.configure_tags(start_index)
-            self.text_box.see(start_index)
-        else:
-            self.select_all_matches()
+    @staticmethod
+    def handler_name(func):
+        name = getattr(func, "__qualname__", None) or repr(func)
+        if name.endswith("after.<locals>.callit"):
+            return f"after {func.__name__}" #after() wraps its callback but keeps the callback's name.
+        if "<lambda>" in name:
+            name += f":{func.__code__.co_firstlineno}"
+        return name.replace(".<locals>", "")
 
-    def select_all_matches(self):
-        self.text_box.tag_remove("fake_sel", "1.0", "end")
-        self.text_box.tag_remove("sel", "1.0", "end")
-        self.text_box.tag_configure("fake_sel", background="grey", foreground="white")
-        for match in self.matches:
-            start_index = self.text_box.index(f"1.0 + {match.start()} chars")
-            end_index = self.text_box.index(f"1.0 + {match.end()} chars")
-            self.text_box.tag_add("sel", start_index, end_index)
-            self.text_box.tag_add("fake_sel", start_index, end_index)
+    def record(self, func, seconds, batch_calls):
+        name = self.handler_name(func)
+        stats = self.handlers.get(name)
+        if stats is None:
+            stats = self.handlers[name] = {"count": 0, "total": 0.0, "max": 0.0, "batch_calls": 0,
+                                           "recent": deque(maxlen=self.HISTORY)}
+        stats["count"] += 1
+        stats["total"] += seconds
+        stats["batch_calls"] += batch_calls #Only TclBatch flushes are counted, not every Tcl call.
+        if seconds > stats["max"]:
+            stats["max"] = seconds
+        stats["recent"].append(seconds)
 
-    def clamp_match_index(self, direction):
-        wrap_around = self.wrap_var.get()
-        first_up_search = -2
-        if wrap_around and self.find_index != first_up_search:
-            self.find_index %= len(self.matches)
-        else:
-            last_match = len(self.matches)-1
-            if direction == "Up" and self.find_index < 0:
-                self.find_index = 0
-            elif direction == "Down" and self.find_index > last_match:
-                self.find_index = last_match
+    def frame_tick(self):
+        now = time.perf_counter()
+        self.frame_times.append(now - self.last_tick) #Anything that blocked the event loop stretches this gap.
+        self.last_tick = now
+        if (now - self.last_report) * 1000 >= self.FRAME_REPORT_MS:
+            self.last_report = now
+            self.frame_label.config(text=f"Frame: {max(self.frame_times) * 1000:.0f} ms")
+        self.window.tk.call("after", self.FRAME_MS, "::texteditor_frame_tick")
 
-    def configure_tags(self, start_index):
-        self.text_box.tag_remove("fake_sel", "1.0", "end")
-        self.text_box.tag_remove("sel", "1.0", "end")
-        self.text_box.tag_configure("fake_sel", background="grey", foreground="white")
-        self.text_box.tag_add("sel", start_index, self.cursor_index)
-        self.text_box.tag_add("fake_sel", start_index, self.cursor_index)
+    @staticmethod
+    def percentile(ordered, fraction):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
 
-    def close(self):
-        if self.cursor_index != 0:
-            self.text_box.mark_set("insert", self.cursor_index)
-        self.find_window.destroy()
+    def histogram(self, timings):
+        counts = [0] * (len(self.BUCKETS_MS) + 1)
+        for seconds in timings:
+            counts[bisect.bisect_left(self.BUCKETS_MS, seconds * 1000)] += 1
+        labels = [f"<={limit}ms" for limit in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+        return {label: count for label, count in zip(labels, counts) if count}
 
-class ReplaceDialogue(FindDialogue):
-    def __init__(self, text_box):
-        FindDialogue.__init__(self,text_box)
-        self.find_window.title("Find And Replace")
-        replace_frame = ttk.Frame(self.window_frame)
-        replace_label = ttk.Label(replace_frame,text="Replace:",font=(font.nametofont("TkDefaultFont"), 10))
-        self.replace_input = tk.StringVar()
-        self.replace_entry = ttk.Entry(replace_frame,width=55,textvariable=self.replace_input)
-        self.replace_entry.bind("<Return>", self.replace)
-        replace_label.pack(side="left",padx=(0,5),fill="x", expand=True)
-        self.replace_entry.pack(side="left")
-        self.replace_button = ttk.Button(replace_frame,text="Replace", command=self.replace)
-        self.replace_button.pack(side="right",padx=8,anchor="e")
-        replace_frame.pack(pady=(10,0))
+    def snapshot(self):
+        handlers = {}
+        for name, stats in sorted(self.handlers.items(), key=lambda item: -item[1]["total"]):
+            recent = sorted(stats["recent"])
+            handlers[name] = {"count": stats["count"], "total_ms": stats["total"] * 1000,
+                              "mean_ms": stats["total"] * 1000 / stats["count"], "max_ms": stats["max"] * 1000,
+                              "p50_ms": self.percentile(recent, 0.5) * 1000, "p95_ms": self.percentile(recent, 0.95) * 1000,
+                              "batch_calls": stats["batch_calls"], "histogram": self.histogram(recent)}
+        frames = sorted(self.frame_times)
+        return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+                "profile_seconds": time.perf_counter() - self.profile_started if self.profiler is not None else None,
+                "frame_ms": {"target": self.FRAME_MS, "p50": self.percentile(frames, 0.5) * 1000,
+                             "max": frames[-1] * 1000} if frames else None,
+                "tcl_batch": {"operations": TclBatch.total_operations, "calls": TclBatch.total_calls},
+                "handlers": handlers}
 
-    def replace(self, event=None):
-        user_input = self.replace_input.get()
-        is_space = any(char.isspace() for char in user_input)
-        if user_input == "":
-            messagebox.showerror("Empty replace error", "Error: must input valid text. Try again...")
-            return
-        if is_space:
-            messagebox.showerror("Whitespace error", "Error: cannot replace whitespace. Try again...")
-            return
-        if self.matches:
-            self.replace_matches(user_input)
-        else:
-            self.text_box.bell()
+    def start_profile(self):
+        import cProfile #Deferred, it is only needed once profiling is switched on.
+        self.handlers = {} #The snapshot saved with the profile covers the same stretch of time.
+        self.profiler = cProfile.Profile()
+        self.profile_started = time.perf_counter()
+        self.profiler.enable()
 
-    def replace_single_match(self, user_input):
-        current_match = self.matches[self.find_index]
-        start_index = self.text_box.index(f"1.0 + {current_match.start()} chars")
-        end_index = self.text_box.index(f"1.0 + {current_match.end()} chars")
-        self.text_box.delete(start_index, end_index)
-        self.text_box.insert(start_index, user_input)
-        self.matches = self.find_matches()
-        self.find_index = -1
-        end_row, end_col = end_index.split(".")
-        end_col = int(end_col)
-        end_col -= (len(current_match.group()) - len(user_input))
-        end_index = f"{end_row}.{end_col}"
-        self.cursor_index = end_index
-        self.clicked_next = False
+    def stop_profile(self):
+        self.profiler.disable()
+        path = os.path.join(config_dir(), "profiles")
+        os.makedirs(path, exist_ok=True)
+        name = time.strftime("profile-%Y%m%d-%H%M%S")
+        stats_path = os.path.join(path, name + ".prof")
+        self.profiler.dump_stats(stats_path)
+        with open(os.path.join(path, name + ".json"), "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+        self.profiler = None
+        return stats_path
 
-    def replace_all_matches(self, user_input):
-        for match in reversed(self.matches):
-            start_index = self.text_box.index(f"1.0 + {match.start()} chars")
-            end_index = self.text_box.index(f"1.0 + {match.end()} chars")
-            self.text_box.delete(start_index, end_index)
-            self.text_box.insert(start_index, user_input)
-        self.matches = self.find_matches()
-        self.find_index = -1
+def tab_attribute(name):
+    #Per-document state lives on the selected tab, the editor reads and writes it through these.
+    return property(lambda self: getattr(self.tab, name), lambda self, value: setattr(self.tab, name, value))
 
-    def replace_matches(self, user_input):
-        if not self.match_all_var.get():
-            if not self.clicked_next:
-                self.text_box.bell()
-                return
-            self.replace_single_match(user_input)
-        else:
-            self.replace_all_matches(user_input)
+class EditorTab:
+    def __init__(self, text_editor):
+        self.current_file_path = None
+        self.file_name = "untitled"
+        self.word_wrap = True
+        self.python_mode = False
+        self.modified = False
+        self.backspace_id: Optional[str] = None
+        self.space_id: Optional[str] = None
+        self.key_release_id: Optional[str] = None
+        self.viewer: Optional[FileViewer] = None
+        self.loader: Optional[FileLoader] = None
+        self.saver: Optional[FileSaver] = None
+        self.reader: Optional[FileReader] = None
+        self.save_again = False
+        self.file_encoding = "utf-8"
+        self.file_newline: Optional[str] = None
+        self.content_hash: Optional[str] = None #Of the file on disk, while the document still matches it.
+        self.content_version = 0
+        self.frame, self.text_box, self.vertical_scrollbar = text_editor.create_text_area(self)
+        self.edit_observer = EditObserver(self.text_box)
+        self.document = Document()
+        self.edit_observer.add_listener(self.document.text_edited)
+        self.highlighter = SyntaxHighlighter(self.text_box, self.document, PythonLexer())
+        self.edit_observer.add_listener(self.highlighter.text_edited)
+        self.undo_history = UndoHistory(self.text_box, TextEditor.UNDO_BUDGET)
+        self.edit_observer.add_listener(self.undo_history.text_edited)
+        self.journal = EditJournal(self.text_box, self.document)
+        self.edit_observer.add_listener(self.journal.text_edited)
+        self.symbols = SymbolIndex(self.text_box, self.document, lambda index: text_editor.symbols_updated(self))
+        self.edit_observer.add_listener(self.symbols.text_edited)
+        self.completions = CompletionIndex(self.text_box, self.document)
+        self.edit_observer.add_listener(self.completions.text_edited)
+        self.completion_popup = CompletionPopup(self.text_box, self.completions)
+        self.margins = ViewMargins(self.frame, self.text_box, self.document, self.highlighter)
+        self.edit_observer.add_listener(self.margins.text_edited)
+
+    def is_blank(self):
+        return self.current_file_path is None and not self.modified and len(self.document) == 0
+
+    def close(self):
+        if self.saver is not None:
+            self.saver.wait()
+        if self.loader is not None:
+            self.loader.cancel()
+        if self.reader is not None:
+            self.reader.cancel()
+        if self.viewer is not None:
+            self.viewer.close()
+        self.highlighter.close()
+        self.symbols.cancel()
+        self.completions.cancel()
+        self.completion_popup.close()
+        self.margins.cancel()
+        self.journal.discard()
+        self.edit_observer.close()
+        self.frame.destroy()
 
 class TextEditor:
 
-    MAX_UNDO = 25
-    DUNDERS = get_dunder_methods()
-    BUILTINS = set(dir(builtins))
+    UNDO_BUDGET = 16 * 1024 * 1024 #Bytes of text kept for undo and redo.
+    VIEWER_THRESHOLD = 64 * 1024 * 1024 #Files this big open in the paged read-only viewer.
+    PROGRESS_BYTES = 4 * 1024 * 1024
+    STARTUP_BUDGET_MS = 750 #Time to first window allowed by --startup-check.
+    OUTLINE_LIMIT = 5000
+    PROJECT_FILES = 500 #Python files indexed in each opened file's directory.
+    PROJECT_FILE_BYTES = 2 * 1024 * 1024
+    RELOAD_DIFF_LINES = 20000 #Changed lines beyond this are swapped in as one block instead of diffed.
+    DUNDERS: Optional[set] = None #Built by load_name_tables the first time Python code is lexed.
+    BUILTINS: Optional[set] = None
     LIGHT_THEME_COLOURS = {"comments": "red", "strings": "light blue",
                                 "keywords": "orange", "names": "black", "builtins": "purple",
                                 "self": "orange", "dunders": "purple", "numbers": "darkblue", "op": "black",
@@ -265,33 +3326,158 @@ class TextEditor:
                                "keywords": "orange", "names": "white", "builtins": "#eb9cf7",
                                "self": "orange", "dunders": "#eb9cf7", "numbers": "light blue", "op": "white",
                                "functions": "#52aeba"}
+    LIGHT_TEXT_COLOURS = {"insertbackground": "black", "background": "white", "foreground": "black"}
+    DARK_TEXT_COLOURS = {"insertbackground": "white", "background": "#152e3d", "foreground": "white"}
+    LIGHT_MARGIN_COLOURS = {"background": "#f3f3f3", "foreground": "grey", "view": "#d6d6d6"}
+    DARK_MARGIN_COLOURS = {"background": "#10242f", "foreground": "#7f98a6", "view": "#254a60"}
 
-    def __init__(self):
-        self.undo_stack = []
-        self.redo_stack = []
-        self.current_file_path = None
-        self.file_name = "untitled"
-        self.word_wrap = True
-        self.python_mode = False
-        self.recent_files = []
+    text_box = tab_attribute("text_box")
+    vertical_scrollbar = tab_attribute("vertical_scrollbar")
+    document = tab_attribute("document")
+    highlighter = tab_attribute("highlighter")
+    undo_history = tab_attribute("undo_history")
+    journal = tab_attribute("journal")
+    current_file_path = tab_attribute("current_file_path")
+    file_name = tab_attribute("file_name")
+    word_wrap = tab_attribute("word_wrap")
+    python_mode = tab_attribute("python_mode")
+    backspace_id = tab_attribute("backspace_id")
+    space_id = tab_attribute("space_id")
+    key_release_id = tab_attribute("key_release_id")
+    viewer = tab_attribute("viewer")
+    loader = tab_attribute("loader")
+    file_encoding = tab_attribute("file_encoding")
+    file_newline = tab_attribute("file_newline")
+
+    def __init__(self, recover=True):
+        self.tab: Optional[EditorTab] = None
+        self.tabs = []
+        self.dark = False
+        self.text_font = ("Arial", 12)
+        self.session = SessionStore(os.path.join(config_dir(), "session.sqlite3"))
         self.recent_files_menu: Optional[tk.Menu] = None
         self.options_menu: Optional[tk.Menu] = None
-        self.backspace_id: Optional[str] = None
-        self.space_id: Optional[str] = None
-        self.key_release_id: Optional[str] = None
+        self.indexed_directories = set()
+        self.outline_items = {}
+        self.instrumentation = Instrumentation()
+        self.instrumentation.install() #Before any widget registers a callback, so every handler is timed.
         self.window = self.setup_window()
+        self.updates = self.create_update_scheduler()
+        self.watcher = FileWatcher(self.window, self.file_changed)
         self.create_menu_bar()
         self.create_window_bindings()
-        self.text_box = self.create_text_area()
-        self.configure_tags(TextEditor.LIGHT_THEME_COLOURS)
-        self.status_label, self.text_row_label, self.text_col_label = self.create_status_info()
+        self.notebook = self.create_notebook()
+        self.outline_frame, self.outline = self.create_outline()
+        self.status_label, self.text_row_label, self.text_col_label, self.frame_label, self.progress_bar = self.create_status_info()
+        self.instrumentation.start_frame_meter(self.window, self.frame_label)
+        self.new_file()
+        if recover:
+            self.offer_recovery()
 
     def setup_window(self):
         window = tk.Tk()
-        window.title(self.file_name)
+        window.title("untitled")
         window.protocol("WM_DELETE_WINDOW", self.close)
         return window
 
+    def create_update_scheduler(self):
+        updates = UpdateScheduler(self.window)
+        #Lower runs first: scroll before the highlighter reads the view, labels and title last.
+        updates.add_task("see", 0, lambda: self.text_box.see(tk.INSERT))
+        updates.add_task("highlight", 1, lambda tab: self.highlight_text(tab=tab))
+        updates.add_task("cursor", 2, self.text_interact)
+        updates.add_task("title", 3, self.set_title)
+        updates.add_task("completion", 4, lambda tab: tab.completion_popup.refresh())
+        return updates
+
+    def create_outline(self):
+        outline_frame = ttk.Frame(self.window) #Packed by toggle_outline.
+        outline = ttk.Treeview(outline_frame, show="tree", selectmode="browse")
+        outline_scrollbar = ttk.Scrollbar(outline_frame, orient="vertical", command=outline.yview)
+        outline.config(yscrollcommand=outline_scrollbar.set)
+        outline.bind("<<TreeviewSelect>>", self.outline_selected)
+        outline_scrollbar.pack(side="right", fill="y")
+        outline.pack(side="left", fill="both", expand=True)
+        return outline_frame, outline
+
+    def toggle_outline(self, event=None):
+        if self.outline_frame.winfo_ismapped():
+            self.outline_frame.pack_forget()
+        else:
+            self.outline_frame.pack(side="left", fill="y", before=self.notebook)
+            self.fill_outline()
+        self.update_options_menu()
+
+    def fill_outline(self):
+        if not self.outline_frame.winfo_ismapped():
+            return
+        self.outline.delete(*self.outline.get_children())
+        self.outline_items = {}
+        parents = [""]
+        for name, kind, line, column, depth in self.tab.symbols.symbols[:TextEditor.OUTLINE_LIMIT]:
+            del parents[depth + 1:]
+            label = {"class": f"class {name}", "function": f"def {name}"}.get(kind, name)
+            item = self.outline.insert(parents[-1], "end", text=label, open=kind == "class")
+            self.outline_items[item] = f"{line}.{column}"
+            parents.append(item)
+
+    def outline_selected(self, event=None):
+        index = self.outline_items.get(self.outline.focus())
+        if index is not None:
+            self.jump_to(index)
+
+    def symbols_updated(self, tab):
+        if tab is self.tab:
+            self.fill_outline()
+
+    def go_to_definition(self, event=None):
+        if self.viewer is not None:
+            return
+        word = self.text_box.get("insert wordstart", "insert wordend")
+        if not word.isidentifier():
+            word = self.text_box.get("insert-1c wordstart", "insert-1c wordend") #Cursor just after the name.
+        if not word.isidentifier():
+            self.text_box.bell()
+            return
+        symbol = self.tab.symbols.definitions.get(word)
+        if symbol is not None:
+            self.jump_to(f"{symbol[2]}.{symbol[3]}")
+            return
+        location = self.session.find_symbol(word)
+        if location is not None and os.path.exists(location[0]):
+            self.open_file_at(location[0], f"{location[1]}.{location[2]}")
+            return
+        self.status_label.config(text=f"No definition found for {word}.")
+        self.window.after(7000, lambda: self.status_label.config(text=""))
+
+    def index_project(self, file_path):
+        #Indexes the Python files next to an opened one, so definitions can be found across the project.
+        directory = os.path.dirname(os.path.abspath(file_path))
+        if directory in self.indexed_directories:
+            return
+        self.indexed_directories.add(directory)
+        future = SymbolIndex.submit(index_directory, directory, self.session.indexed_files(directory),
+                                    TextEditor.PROJECT_FILES, TextEditor.PROJECT_FILE_BYTES)
+        self.window.after(SymbolIndex.POLL_MS, self.poll_project_index, directory, future)
+
+    def poll_project_index(self, directory, future):
+        if not future.done():
+            self.window.after(SymbolIndex.POLL_MS, self.poll_project_index, directory, future)
+            return
+        try:
+            present, results = future.result()
+        except Exception:
+            SymbolIndex.pool = None
+            return
+        self.session.save_symbols(directory, present, results)
+
+    def create_notebook(self):
+        notebook = ttk.Notebook(self.window)
+        notebook.enable_traversal() #Ctrl+Tab and Ctrl+Shift+Tab switch tabs.
+        notebook.bind("<<NotebookTabChanged>>", self.tab_changed)
+        notebook.pack(fill="both", expand=True)
+        return notebook
+
     def create_menu_bar(self):
         menu_bar = tk.Menu(self.window)
         self.window.config(menu=menu_bar)
@@ -306,14 +3492,15 @@ class TextEditor:
 
     def create_file_menu(self,menu_bar):
         file_menu = tk.Menu(menu_bar, tearoff=0)
-        file_menu.add_command(label="New File", accelerator="Ctrl+N", command=TextEditor.new_file)
+        file_menu.add_command(label="New File", accelerator="Ctrl+N", command=self.new_file)
         file_menu.add_command(label="Open", accelerator="Ctrl+O", command=self.open)
-        self.recent_files_menu = tk.Menu(file_menu, tearoff=0)
+        self.recent_files_menu = tk.Menu(file_menu, tearoff=0, postcommand=self.fill_recent_files_menu)
         file_menu.add_cascade(label="Recent Files", menu=self.recent_files_menu)
         file_menu.add_separator()
         file_menu.add_command(label="Save", accelerator="Ctrl+S", command=self.save)
         file_menu.add_command(label="Save As", accelerator="Ctrl+Shift+S", command=self.save_as)
         file_menu.add_separator()
+        file_menu.add_command(label="Close Tab", accelerator="Ctrl+W", command=self.close_tab)
         file_menu.add_command(label="Close", accelerator="Ctrl+Q", command=self.close)
         return file_menu
 
@@ -328,6 +3515,9 @@ class TextEditor:
         edit_menu.add_separator()
         edit_menu.add_command(label="Find", accelerator="Ctrl+F", command=self.find)
         edit_menu.add_command(label="Replace", accelerator="Ctrl+Shift+F", command=self.replace)
+        edit_menu.add_command(label="Find In Files", accelerator="Ctrl+Shift+H", command=self.find_in_files)
+        edit_menu.add_command(label="Go To Line", accelerator="Ctrl+L", command=self.go_to_line)
+        edit_menu.add_command(label="Go To Definition", accelerator="F12", command=self.go_to_definition)
         return edit_menu
 
     def create_options_menu(self, menu_bar):
@@ -342,98 +3532,256 @@ class TextEditor:
         options_menu.add_separator()
         options_menu.add_command(label="Word Wrap", accelerator="Ctrl+T", command=self.toggle_word_wrap)
         options_menu.entryconfig("Word Wrap", foreground="grey")
+        options_menu.add_command(label="Outline", accelerator="Ctrl+Shift+O", command=self.toggle_outline)
+        options_menu.add_separator()
+        options_menu.add_command(label="Profiling", accelerator="Ctrl+Shift+P", command=self.toggle_profiling)
         return options_menu
 
     def create_format_menu(self, menu_bar):
         format_menu = tk.Menu(menu_bar, tearoff=0)
         font_menu = tk.Menu(format_menu, tearoff=0)
         font_size_menu = tk.Menu(format_menu, tearoff=0)
+        font_menu.config(postcommand=lambda: self.fill_font_menu(font_menu))
         format_menu.add_cascade(label="Font",menu=font_menu)
         format_menu.add_cascade(label="Font Size", menu=font_size_menu)
-        for font_name in list(font.families()):
-            font_menu.add_command(label=font_name, command=lambda name=font_name: self.set_font(name))
         font_sizes = 30
         for index in range(font_sizes):
             font_size = f"{index * 2 + 2}pt" #Increase the font sizes by increments of 2.
             font_size_menu.add_command(label=font_size,command=lambda size=font_size: self.set_font_size(size))
         return format_menu
 
+    def fill_font_menu(self, font_menu):
+        #Listing the installed fonts can take a while, so it waits until the menu is first opened.
+        if font_menu.index("end") is not None:
+            return
+        for font_name in list(font.families()):
+            font_menu.add_command(label=font_name, command=lambda name=font_name: self.set_font(name))
+
     def set_font(self, font_name):
         current_font = self.text_box.cget("font")
         current_font = font.Font(font=current_font)
-        self.text_box.config(font=(font_name, current_font.actual("size")))
+        self.text_font = (font_name, current_font.actual("size"))
+        for tab in self.tabs:
+            tab.text_box.config(font=self.text_font)
 
     def set_font_size(self, font_size):
         current_font = self.text_box.cget("font")
         current_font = font.Font(font=current_font)
         font_size, _ = font_size.split("p") #Get the number component of font size.
-        self.text_box.config(font=(current_font.actual("family"), int(font_size)))
+        self.text_font = (current_font.actual("family"), int(font_size))
+        for tab in self.tabs:
+            tab.text_box.config(font=self.text_font)
 
     def find(self,event=None):
-        FindDialogue(self.text_box)
+        if self.viewer is not None:
+            ViewerFindDialogue(self.text_box, self.viewer)
+        else:
+            FindDialogue(self.text_box, self.document)
 
     def replace(self, event=None):
-        ReplaceDialogue(self.text_box)
+        if self.viewer is not None:
+            self.text_box.bell()
+            return
+        ReplaceDialogue(self.text_box, self.document, self.undo_history)
+
+    def go_to_line(self, event=None):
+        line = simpledialog.askinteger("Go To Line", "Line:", parent=self.window, minvalue=1)
+        if line is None:
+            return
+        if self.viewer is not None:
+            if not self.viewer.go_to_line(line):
+                self.status_label.config(text="Still indexing lines, try again shortly.")
+                self.window.after(7000, lambda: self.status_label.config(text=""))
+                return
+        else:
+            self.text_box.mark_set("insert", f"{line}.0")
+            self.text_box.see("insert")
+        self.text_interact()
+
+    def find_in_files(self, event=None):
+        FindInFilesDialogue(self)
 
     def toggle_word_wrap(self, event=None):
-        self.word_wrap = not self.word_wrap
-        if self.word_wrap:
-            self.text_box.config(wrap="word")
-            self.options_menu.entryconfig("Word Wrap", foreground="grey")
+        self.set_word_wrap(self.tab, not self.word_wrap)
+
+    def set_word_wrap(self, tab, word_wrap):
+        tab.word_wrap = word_wrap
+        if word_wrap:
+            tab.text_box.config(wrap="word")
         else:
-            self.text_box.config(wrap="none")
-            self.options_menu.entryconfig("Word Wrap", foreground="black")
+            tab.text_box.config(wrap="none")
+        if tab is self.tab:
+            self.update_options_menu()
 
     def enable_python_mode(self, event=None):
-        if self.key_release_id is None:
-            self.key_release_id = self.text_box.bind("<KeyRelease>", self.highlight_text)
-        self.options_menu.entryconfig("Python Mode",foreground="grey")
-        self.options_menu.entryconfig("Text Mode", foreground="black")
-        self.python_mode = True
-        self.clear_highlighting()
-        self.highlight_text()
-        self.bind_space_backspace()
+        self.set_python_mode(self.tab, True)
 
     def enable_text_mode(self, event=None):
-        if self.key_release_id is not None:
-            self.key_release_id = self.text_box.unbind("<KeyRelease>", self.key_release_id)
-        self.options_menu.entryconfig("Python Mode", foreground="black")
-        self.options_menu.entryconfig("Text Mode", foreground="grey")
-        self.python_mode = False
-        self.clear_highlighting()
-        self.unbind_space_backspace()
+        self.set_python_mode(self.tab, False)
+
+    def set_python_mode(self, tab, python_mode):
+        if python_mode and tab.key_release_id is None:
+            tab.key_release_id = tab.text_box.bind("<KeyRelease>", lambda event: self.updates.mark("highlight", tab))
+        elif not python_mode and tab.key_release_id is not None:
+            tab.key_release_id = tab.text_box.unbind("<KeyRelease>", tab.key_release_id)
+        tab.python_mode = python_mode
+        tab.symbols.set_enabled(python_mode and tab.viewer is None)
+        tab.completions.set_enabled(python_mode and tab.viewer is None)
+        tab.highlighter.clear()
+        if python_mode:
+            tab.highlighter.set_lexer(PythonLexer())
+            self.start_highlighting(tab)
+            self.bind_space_backspace(tab)
+        else:
+            tab.completion_popup.close()
+            self.unbind_space_backspace(tab)
+        if tab is self.tab:
+            self.update_options_menu()
 
     def dark_theme(self, event=None):
-        self.text_box.config(insertbackground="white", background="#152e3d", foreground="white")
-        self.configure_tags(TextEditor.DARK_THEME_COLOURS)
-        self.options_menu.entryconfig("Dark Theme", foreground="grey")
-        self.options_menu.entryconfig("Light Theme", foreground="black")
+        self.dark = True
+        for tab in self.tabs:
+            self.apply_theme(tab)
+        self.update_options_menu()
 
     def light_theme(self, event=None):
-        self.text_box.config(insertbackground="black", background="white", foreground="black")
-        self.configure_tags(TextEditor.LIGHT_THEME_COLOURS)
-        self.options_menu.entryconfig("Dark Theme", foreground="black")
-        self.options_menu.entryconfig("Light Theme", foreground="grey")
-
-    def create_text_area(self):
-        editor_frame = ttk.Frame(self.window, padding=(1, 0, 0, 0))
-        text_box = tk.Text(editor_frame, width=55, height=25, padx=5, pady=5,font=("Arial", 12),undo=False,wrap="word")
+        self.dark = False
+        for tab in self.tabs:
+            self.apply_theme(tab)
+        self.update_options_menu()
+
+    def apply_theme(self, tab):
+        tab.text_box.config(**(TextEditor.DARK_TEXT_COLOURS if self.dark else TextEditor.LIGHT_TEXT_COLOURS))
+        self.configure_tags(tab.text_box, TextEditor.DARK_THEME_COLOURS if self.dark else TextEditor.LIGHT_THEME_COLOURS)
+        tab.margins.set_colours(TextEditor.DARK_MARGIN_COLOURS if self.dark else TextEditor.LIGHT_MARGIN_COLOURS,
+                                TextEditor.DARK_THEME_COLOURS if self.dark else TextEditor.LIGHT_THEME_COLOURS)
+
+    def update_options_menu(self):
+        def shade(active):
+            return "grey" if active else "black"
+        self.options_menu.entryconfig("Python Mode", foreground=shade(self.python_mode))
+        self.options_menu.entryconfig("Text Mode", foreground=shade(not self.python_mode))
+        self.options_menu.entryconfig("Dark Theme", foreground=shade(self.dark))
+        self.options_menu.entryconfig("Light Theme", foreground=shade(not self.dark))
+        self.options_menu.entryconfig("Word Wrap", foreground=shade(self.word_wrap))
+        self.options_menu.entryconfig("Outline", foreground=shade(self.outline_frame.winfo_ismapped()))
+        self.options_menu.entryconfig("Profiling", foreground=shade(self.instrumentation.profiler is not None))
+
+    def toggle_profiling(self, event=None):
+        if self.instrumentation.profiler is None:
+            self.instrumentation.start_profile()
+            self.status_label.config(text="Profiling, press Ctrl+Shift+P again to stop.")
+        else:
+            stats_path = self.instrumentation.stop_profile()
+            self.status_label.config(text=f"Profile saved to {stats_path} with a .json metrics snapshot.")
+            self.window.after(7000, lambda: self.status_label.config(text=""))
+        self.update_options_menu()
+
+    def new_file(self, event=None):
+        tab = EditorTab(self)
+        self.tabs.append(tab)
+        self.apply_theme(tab)
+        self.notebook.add(tab.frame, text=tab.file_name)
+        self.select_tab(tab)
+        return tab
+
+    def select_tab(self, tab):
+        if self.tab is not None:
+            self.tab.completion_popup.close()
+        self.tab = tab
+        self.notebook.select(tab.frame)
+        self.update_title(tab)
+        self.update_options_menu()
+        self.fill_outline()
+        self.text_interact()
+        tab.text_box.focus_set()
+
+    def tab_changed(self, event=None):
+        selected = self.notebook.select()
+        for tab in self.tabs:
+            if str(tab.frame) == selected and tab is not self.tab:
+                self.select_tab(tab)
+
+    def tab_for_file(self, file_path):
+        for tab in self.tabs:
+            if tab.current_file_path is not None and os.path.abspath(tab.current_file_path) == os.path.abspath(file_path):
+                return tab
+        return None
+
+    def update_title(self, tab):
+        title = tab.file_name + (" [read-only]" if tab.viewer is not None else "")
+        if tab.modified:
+            title = "*" + title + "*"
+        self.notebook.tab(tab.frame, text=title)
+        if tab is self.tab:
+            self.window.title(title)
+
+    def close_tab(self, event=None):
+        tab = self.tab
+        if tab.modified:
+            response = messagebox.askyesnocancel("Save Changes?", f"Do you want to save changes to {tab.file_name}?")
+            if response is None or (response and not self.save()):
+                return
+        if not self.finish_saving(tab):
+            return
+        self.tabs.remove(tab)
+        self.notebook.forget(tab.frame)
+        self.updates.forget(tab)
+        self.save_session(tab)
+        tab.close()
+        self.watch_open_files()
+        self.tab = None
+        if self.tabs:
+            self.select_tab(self.tabs[-1])
+        else:
+            self.new_file()
+
+    def create_text_area(self, tab):
+        editor_frame = ttk.Frame(self.notebook, padding=(1, 0, 0, 0))
+        text_box = tk.Text(editor_frame, width=55, height=25, padx=5, pady=5,font=self.text_font,undo=False,wrap="word")
         vertical_scrollbar = ttk.Scrollbar(editor_frame, orient="vertical")
-        text_box.config(yscrollcommand=vertical_scrollbar.set)
+        text_box.config(yscrollcommand=lambda first, last: self.text_scrolled(tab, first, last))
         vertical_scrollbar.config(command=text_box.yview)
         vertical_scrollbar.pack(side="right", fill="y")
-        text_box.bind("<ButtonRelease-1>", self.text_interact)
-        text_box.bind("<<Modified>>", self.text_interact)
-        text_box.bind("<<Modified>>", self.set_title, add="+")
+        text_box.bind("<ButtonRelease-1>", lambda event: self.updates.mark("cursor"))
+        text_box.bind("<ButtonRelease-1>", lambda event: tab.completion_popup.close(), add="+")
+        text_box.bind("<<Modified>>", lambda event: self.text_modified(tab))
+        #The popup gets Return, Tab and the arrows first while it is open, "break" keeps them from the text.
+        text_box.bind("<Control-space>", lambda event: tab.completion_popup.open())
+        text_box.bind("<Escape>", lambda event: tab.completion_popup.close())
+        text_box.bind("<Up>", lambda event: tab.completion_popup.move(-1))
+        text_box.bind("<Down>", lambda event: tab.completion_popup.move(1))
         text_box.bind("<space>", self.save_word)
-        text_box.bind("<Return>", self.save_word)
-        text_box.bind("<Tab>", self.save_word)
+        text_box.bind("<Return>", lambda event: tab.completion_popup.accept())
+        text_box.bind("<Return>", self.save_word, add="+")
+        text_box.bind("<Tab>", lambda event: tab.completion_popup.accept())
+        text_box.bind("<Tab>", self.save_word, add="+")
         text_box.bind("<Tab>", self.handle_indent, add="+")
-        text_box.bind("<Key>", lambda t=text_box: text_box.see(tk.INSERT))
+        text_box.bind("<Key>", lambda event: self.key_pressed(tab))
         text_box.pack(fill="both", expand=True)
-        editor_frame.pack(fill="both", expand=True)
         self.window.after(50, lambda:editor_frame.pack_propagate(False)) #Stops the text editor frame from resizing when font size and font changes.
-        return text_box
+        return editor_frame, text_box, vertical_scrollbar
+
+    def key_pressed(self, tab):
+        self.updates.mark("see")
+        if tab.completion_popup.is_open():
+            self.updates.mark("completion", tab) #After the key's own binding has changed the text.
+
+    def text_modified(self, tab):
+        if not tab.text_box.edit_modified():
+            return #Fired by set_title clearing the flag, not by an edit.
+        if tab.highlighter.enabled:
+            self.updates.mark("highlight", tab)
+        self.updates.mark("cursor")
+        self.updates.mark("title", tab)
+
+    def text_scrolled(self, tab, first, last):
+        if tab.viewer is not None:
+            tab.viewer.view_changed(first, last)
+        else:
+            tab.vertical_scrollbar.set(first, last)
+        tab.highlighter.view_changed()
+        tab.margins.request()
 
     def create_window_bindings(self):
         self.create_file_bindings()
@@ -441,10 +3789,11 @@ class TextEditor:
         self.create_options_bindings()
 
     def create_file_bindings(self):
-        self.window.bind("<Control-n>", TextEditor.new_file)
+        self.window.bind("<Control-n>", self.new_file)
         self.window.bind("<Control-o>", self.open)
         self.window.bind("<Control-s>", self.save)
         self.window.bind("<Control-S>", self.save_as)
+        self.window.bind("<Control-w>", self.close_tab)
         self.window.bind("<Control-q>", self.close)
 
     def create_edit_bindings(self):
@@ -460,6 +3809,9 @@ class TextEditor:
         self.window.bind_class("Text", "<Control-v>", self.paste)
         self.window.bind("<Control-f>", self.find)
         self.window.bind("<Control-F>", self.replace)
+        self.window.bind("<Control-H>", self.find_in_files)
+        self.window.bind("<Control-l>", self.go_to_line)
+        self.window.bind("<F12>", self.go_to_definition)
 
     def create_options_bindings(self):
         self.window.bind("<Control-g>", self.dark_theme)
@@ -467,17 +3819,22 @@ class TextEditor:
         self.window.bind("<Control-t>", self.toggle_word_wrap)
         self.window.bind("<Alt-m>", self.enable_python_mode)
         self.window.bind("<Alt-c>", self.enable_text_mode)
+        self.window.bind("<Control-P>", self.toggle_profiling)
+        self.window.bind("<Control-O>", self.toggle_outline)
 
     def create_status_info(self):
         status_frame = ttk.Frame(self.window)
         status_label = ttk.Label(status_frame, text="")
         text_row_label = ttk.Label(status_frame, text="Ln: 0", padding=(0, 0, 8, 0))
         text_col_label = ttk.Label(status_frame, text="Col: 0", padding=(0, 0, 5, 0))
+        frame_label = ttk.Label(status_frame, text="Frame: 0 ms", padding=(0, 0, 12, 0)) #Longest event loop stall in the last second.
+        progress_bar = ttk.Progressbar(status_frame, length=150, maximum=100) #Only packed while a big file loads.
         text_col_label.pack(side="right")
         text_row_label.pack(side="right")
+        frame_label.pack(side="right")
         status_label.pack(side="left",padx=(5,0), pady=(2,2))
         status_frame.pack(fill="x")
-        return status_label, text_row_label, text_col_label
+        return status_label, text_row_label, text_col_label, frame_label, progress_bar
 
     def run_editor(self):
         self.window.mainloop()
@@ -511,25 +3868,24 @@ class TextEditor:
 
     def set_file_name(self, file_path):
         self.file_name = os.path.basename(file_path)
-        self.window.title(self.file_name)
+        self.update_title(self.tab)
 
-    def set_title(self,event=None):
-        if self.text_box.edit_modified():
-            self.text_box.edit_modified(False)
-            self.window.title("*" + self.file_name + "*")
-
-    @staticmethod
-    def new_file(event=None):
-        if getattr(sys, 'frozen', False):
-            subprocess.Popen([sys.executable])
-        else:
-            subprocess.Popen([sys.executable, __file__])
+    def set_title(self, tab):
+        if tab.viewer is not None or tab.loader is not None:
+            tab.text_box.edit_modified(False) #Swapping pages or loading isn't a change to the file.
+            return
+        if tab.text_box.edit_modified():
+            tab.text_box.edit_modified(False)
+            if not tab.modified:
+                tab.modified = True
+                self.update_title(tab)
 
     def cut(self, event=None):
         try:
             self.save_word()
             selected_text = self.text_box.get("sel.first", "sel.last")
             self.text_box.delete("sel.first", "sel.last")
+            self.save_word()
             self.text_box.clipboard_clear()
             self.text_box.clipboard_append(selected_text)
         except tk.TclError:
@@ -538,10 +3894,10 @@ class TextEditor:
     def paste(self, event=None):
         try:
             self.save_word()
-            self.redo_stack.clear()
             cursor_pos = self.text_box.index(tk.INSERT)
             pasted_text = self.text_box.clipboard_get().rstrip()
             self.text_box.insert(cursor_pos,pasted_text)
+            self.save_word()
         except tk.TclError:
             pass
         return "break"
@@ -550,195 +3906,374 @@ class TextEditor:
         self.text_box.tag_add("sel", "1.0", "end")
 
     def undo(self,event=None):
-        current_text = self.text_box.get("1.0", "end-1c")
-        self.text_box.delete("1.0", tk.END)
-        if self.redo_stack:
-            last_item = self.redo_stack[-1]
-        else:
-            last_item = None
-        if self.undo_stack:
-            last_state = self.undo_stack.pop()
-            self.redo_stack.append(current_text)
-            self.text_box.insert("1.0", last_state)
-        else:
-            self.remove_duplicates(last_item,current_text)
-        self.remove_empty_strings()
-        if self.python_mode:
-            self.highlight_text()
+        index = self.undo_history.undo()
+        self.move_cursor(index)
 
     def redo(self,event=None):
-        if self.redo_stack:
-            next_state = self.redo_stack.pop()
-            current_text = self.text_box.get("1.0", "end-1c")
-            self.undo_stack.append(current_text)
-            self.text_box.delete("1.0", tk.END)
-            self.text_box.insert("1.0", next_state)
+        index = self.undo_history.redo()
+        self.move_cursor(index)
+
+    def move_cursor(self, index):
+        if index is not None:
+            self.text_box.mark_set(tk.INSERT, index)
+            self.text_box.see(index)
             if self.python_mode:
                 self.highlight_text()
 
-    def remove_empty_strings(self):
-        for string in self.redo_stack[:]:
-            if string == "":
-                self.redo_stack.remove(string)
-
-    def remove_duplicates(self, last_item, current_text):
-        if len(self.redo_stack) > 1:
-            if last_item != self.redo_stack[-2]:
-                self.redo_stack.append(current_text)
-        else:
-            self.redo_stack.append(current_text)
-            self.redo_stack = list(dict.fromkeys(self.redo_stack))
-
-    def bind_space_backspace(self):
-        if self.backspace_id is None and self.space_id is None:
-            self.space_id = self.text_box.bind("<space>", self.handle_spaces, add="+")
-            self.backspace_id = self.text_box.bind("<BackSpace>", self.handle_backspace)
-
-    def unbind_space_backspace(self):
-        if self.backspace_id is not None and self.space_id is not None:
-            self.space_id = self.text_box.unbind("<space>", self.space_id)
-            self.backspace_id = self.text_box.unbind("<BackSpace>", self.backspace_id)
-
-    def highlight_if_python(self):
-        if self.window.title().endswith(".py"):
-            self.bind_space_backspace()
-            self.highlight_text()
-            self.options_menu.entryconfig("Python Mode", foreground="grey")
-            self.options_menu.entryconfig("Text Mode", foreground="black")
-            self.options_menu.entryconfig("Word Wrap", foreground="black")
-            self.text_box.config(wrap="none")
-            self.word_wrap = False
-            self.python_mode = True
-        else:
-            self.options_menu.entryconfig("Python Mode", foreground="black")
-            self.options_menu.entryconfig("Text Mode", foreground="grey")
-            self.options_menu.entryconfig("Word Wrap", foreground="grey")
-            self.text_box.config(wrap="word")
-            self.word_wrap = True
-            self.python_mode = False
-            self.unbind_space_backspace()
+    def bind_space_backspace(self, tab):
+        if tab.backspace_id is None and tab.space_id is None:
+            tab.space_id = tab.text_box.bind("<space>", self.handle_spaces, add="+")
+            tab.backspace_id = tab.text_box.bind("<BackSpace>", self.handle_backspace)
+
+    def unbind_space_backspace(self, tab):
+        if tab.backspace_id is not None and tab.space_id is not None:
+            tab.space_id = tab.text_box.unbind("<space>", tab.space_id)
+            tab.backspace_id = tab.text_box.unbind("<BackSpace>", tab.backspace_id)
+
+    def highlight_if_python(self, tab):
+        lexer = lexer_for(tab.file_name)
+        if lexer is not None:
+            tab.highlighter.set_lexer(lexer())
+            self.bind_space_backspace(tab)
+            self.start_highlighting(tab)
+            tab.text_box.config(wrap="none")
+            tab.word_wrap = False
+            tab.python_mode = True
+        else:
+            tab.text_box.config(wrap="word")
+            tab.word_wrap = True
+            tab.python_mode = False
+            self.unbind_space_backspace(tab)
+        tab.symbols.set_enabled(tab.python_mode and tab.viewer is None)
+        tab.completions.set_enabled(tab.python_mode and tab.viewer is None)
+        if tab.python_mode and tab.current_file_path is not None:
+            self.index_project(tab.current_file_path)
+        if tab is self.tab:
+            self.update_options_menu()
 
     def open(self,event=None):
         file_types=(("Text Files", "*.txt"),("Python Files", "*.py"))
         file_path = filedialog.askopenfilename(title="Open a file...",filetypes=file_types)
-        editor_text = self.text_box.get("1.0","end-1c")
-        editor_text = editor_text.strip()
         if file_path:
-            self.current_file_path = file_path
-            self.set_file_name(file_path)
-            self.update_recent_files(file_path)
-            if editor_text:
-                self.text_box.delete("1.0", tk.END)
-            index = 1
-            with open(self.current_file_path) as file:
-                lines = file.readlines()
-                for line in lines:
-                    self.text_box.insert(f"{index}.0",line)
-                    index += 1
-                self.highlight_if_python()
-                self.undo_stack.clear()
-                self.redo_stack.clear()
-            self.text_box.edit_modified(False)
+            self.load_file(file_path)
+
+    def load_file(self, file_path, index=None):
+        open_tab = self.tab_for_file(file_path)
+        if open_tab is not None and open_tab.loader is None:
+            self.select_tab(open_tab)
+            if index is not None:
+                self.jump_to(index)
+            return
+        if open_tab is not None:
+            self.select_tab(open_tab)
+        elif not self.tab.is_blank():
+            self.new_file()
+        if os.path.getsize(file_path) >= TextEditor.VIEWER_THRESHOLD:
+            self.open_viewer(file_path)
+            return
+        self.close_viewer()
+        if self.loader is not None:
+            self.loader.cancel()
+        tab = self.tab
+        self.current_file_path = file_path
+        self.set_file_name(file_path)
+        self.update_recent_files(file_path)
+        self.undo_history.paused = True
+        self.journal.paused = True
+        self.text_box.delete("1.0", tk.END)
+        self.loader = FileLoader(self.text_box, file_path, lambda loader: self.load_progress(tab, loader),
+                                 lambda loader: self.load_finished(tab, loader, index))
+
+    def load_progress(self, tab, loader):
+        if loader.size < TextEditor.PROGRESS_BYTES or tab is not self.tab:
+            return
+        if not self.progress_bar.winfo_ismapped():
+            self.progress_bar.pack(side="left", padx=(5, 0))
+        self.progress_bar.config(value=loader.progress() * 100)
+        self.status_label.config(text=f"Loading {tab.file_name}... {loader.progress():.0%}")
+
+    def load_finished(self, tab, loader, index):
+        tab.loader = None
+        tab.text_box.config(state="normal")
+        self.progress_bar.pack_forget()
+        tab.undo_history.paused = False
+        tab.journal.paused = False
+        if loader.error is not None:
+            #The tab was emptied for the load, so it goes back to being untitled rather than pointing at the file.
+            tab.current_file_path = None
+            tab.file_name = "untitled"
+            tab.modified = False
+            tab.text_box.edit_modified(False)
+            self.update_title(tab)
+            self.watch_open_files()
+            messagebox.showerror("Open Failed", f"Could not read {loader.file_path}: {loader.error.strerror}")
+            return
+        tab.file_encoding = loader.encoding
+        tab.file_newline = loader.newline
+        tab.content_hash = loader.content_hash
+        tab.content_version = tab.document.version
+        self.watch_open_files()
+        self.highlight_if_python(tab)
+        tab.undo_history.clear()
+        tab.journal.reset(loader.file_path)
+        tab.text_box.edit_modified(False)
+        tab.modified = False
+        self.update_title(tab)
+        self.restore_session(tab, index)
+        elapsed, rate = loader.throughput()
+        self.status_label.config(text=f"Loaded {loader.size / 1048576:.1f} MB in {elapsed:.2f}s ({rate / 1048576:.1f} MB/s)")
+        self.window.after(7000, lambda: self.status_label.config(text=""))
+
+    def open_viewer(self, file_path):
+        self.close_viewer()
+        self.current_file_path = file_path
+        self.set_file_name(file_path)
+        self.update_recent_files(file_path)
+        self.journal.discard()
+        self.journal.paused = True
+        self.undo_history.paused = True
+        self.undo_history.clear()
+        self.viewer = FileViewer(self.text_box, self.vertical_scrollbar, file_path)
+        self.tab.margins.set_enabled(False) #Line numbers of a paged file aren't known.
+        self.watch_open_files()
+        self.tab.modified = False
+        self.update_title(self.tab)
+        self.highlight_if_python(self.tab)
+        self.text_interact()
+
+    def close_viewer(self):
+        if self.viewer is None:
+            return
+        self.viewer.close()
+        self.viewer = None
+        self.tab.margins.set_enabled(True)
+        self.vertical_scrollbar.config(command=self.text_box.yview)
+        self.text_box.config(state="normal")
+        self.journal.paused = False
+        self.undo_history.paused = False
 
     def save(self,event=None):
+        if self.viewer is not None or self.loader is not None:
+            return False
         if self.current_file_path:
-            with open(self.current_file_path,"w") as file:
-                file.write(self.text_box.get("1.0", "end-1c"))
-                self.text_box.edit_modified(False)
-                self.window.title(self.file_name)
-            self.status_label.config(text="File has been saved.")
-            self.window.after(7000, lambda: self.status_label.config(text=""))
+            self.write_file(self.tab, self.current_file_path)
             return True
         else:
             saved = self.save_as()
             return saved
 
     def save_as(self,event=None):
+        if self.viewer is not None or self.loader is not None:
+            return False
         file_types = (("Text files", "*.txt"),("Python Files","*.py"))
         file_path = filedialog.asksaveasfilename(defaultextension=".txt",filetypes=file_types)
         if file_path:
             self.current_file_path = file_path
             self.set_file_name(file_path)
             self.update_recent_files(file_path)
-            with open(self.current_file_path, "w") as file:
-                file.write(self.text_box.get("1.0", "end-1c"))
-                self.text_box.edit_modified(False)
-            self.status_label.config(text="File has been saved.")
-            self.window.after(7000, lambda: self.status_label.config(text=""))
+            self.write_file(self.tab, file_path)
             return True
         else:
             return False
 
+    def write_file(self, tab, file_path):
+        if tab.saver is not None:
+            tab.save_again = True #Another save is still writing, save again once it has finished.
+            return
+        tab.text_box.edit_modified(False)
+        tab.modified = False
+        self.update_title(tab)
+        tab.saver = FileSaver(tab.text_box, file_path, tab.document.text(), tab.document.version,
+                              tab.file_encoding, tab.file_newline, self.save_progress,
+                              lambda saver: self.save_finished(tab, saver))
+
+    def save_progress(self, saver):
+        self.status_label.config(text=f"Saving {os.path.basename(saver.file_path)}... {saver.progress():.0%}")
+
+    def save_finished(self, tab, saver):
+        tab.saver = None
+        if saver.error is not None:
+            tab.modified = True
+            self.update_title(tab)
+            self.status_label.config(text="")
+            messagebox.showerror("Save Failed", f"Could not save {saver.file_path}: {saver.error}")
+            return
+        tab.journal.reset(saver.file_path)
+        tab.content_hash = saver.content_hash
+        tab.content_version = saver.version
+        self.watch_open_files()
+        self.watcher.update(saver.file_path)
+        if tab.document.version != saver.version:
+            tab.journal.snapshot() #Edits made while saving aren't in the file yet, keep them recoverable.
+        self.status_label.config(text=f"File has been saved in {saver.elapsed():.2f}s.")
+        self.window.after(7000, lambda: self.status_label.config(text=""))
+        if tab.save_again:
+            tab.save_again = False
+            self.write_file(tab, tab.current_file_path)
+
+    def finish_saving(self, tab):
+        #Closing mustn't outrun a save, a failed write has to keep the tab, its journal and the chance to retry.
+        while tab.saver is not None:
+            saver = tab.saver
+            saver.wait()
+            self.save_finished(tab, saver) #Starts the queued save_again, if any, which is waited for in turn.
+            if saver.error is not None:
+                return False
+        return True
+
+    def watch_open_files(self):
+        self.watcher.sync(tab.current_file_path for tab in self.tabs
+                          if tab.current_file_path is not None and tab.viewer is None and tab.loader is None)
+
+    def file_changed(self, file_path):
+        tab = self.tab_for_file(file_path)
+        if tab is None or tab.viewer is not None or tab.loader is not None or tab.saver is not None:
+            return
+        if tab.reader is not None:
+            tab.reader.cancel() #Changed again before the last read finished, only the newest contents count.
+        tab.reader = FileReader(tab.text_box, file_path, tab.content_hash, lambda reader: self.change_read(tab, reader))
+
+    def change_read(self, tab, reader):
+        tab.reader = None
+        if tab.viewer is not None or tab.loader is not None or tab.saver is not None:
+            return
+        if tab.content_hash != reader.known_hash:
+            return #Saved or reloaded while the file was read, what was read may be out of date.
+        if reader.error is not None:
+            tab.modified = True #Gone from disk, closing the tab now asks to save it again.
+            self.update_title(tab)
+            self.status_label.config(text=f"{tab.file_name} was moved or deleted by another program.")
+            return
+        if reader.content_hash == tab.content_hash:
+            return #Touched or saved again with the same bytes.
+        if tab.modified or tab.document.version != tab.content_version:
+            self.select_tab(tab)
+            if not messagebox.askyesno("File Changed", f"{tab.file_name} has been changed by another program.\n"
+                                                       "Reload it and discard your changes?"):
+                return
+            if tab not in self.tabs or tab.saver is not None or tab.content_hash != reader.known_hash:
+                return #Closed or saved while the question was open.
+        self.reload_file(tab, reader)
+
+    def reload_file(self, tab, reader):
+        #Only the lines that differ are replaced, so the cursor, view and highlighting elsewhere are kept.
+        old_lines = keep_ends(tab.document.text())
+        new_lines = keep_ends(reader.text)
+        tab.undo_history.checkpoint()
+        for old_start, old_stop, new_start, new_stop in reversed(line_changes(old_lines, new_lines, TextEditor.RELOAD_DIFF_LINES)):
+            start = f"{old_start + 1}.0"
+            if old_start < old_stop:
+                tab.text_box.delete(start, f"{old_stop + 1}.0" if old_stop < len(old_lines) else "end-1c")
+            if new_start < new_stop:
+                tab.text_box.insert(start, "".join(new_lines[new_start:new_stop]))
+        tab.undo_history.checkpoint()
+        tab.file_encoding = reader.encoding
+        tab.file_newline = reader.newline
+        tab.content_hash = reader.content_hash
+        tab.content_version = tab.document.version
+        tab.journal.reset(tab.current_file_path)
+        tab.text_box.edit_modified(False)
+        tab.modified = False
+        self.update_title(tab)
+        if tab.highlighter.enabled:
+            self.updates.mark("highlight", tab)
+        self.updates.mark("cursor")
+        self.status_label.config(text=f"Reloaded {tab.file_name}, it was changed by another program.")
+        self.window.after(7000, lambda: self.status_label.config(text=""))
+
     def text_interact(self,event=None):
         cursor_pos = self.text_box.index(tk.INSERT)
         cursor_pos = cursor_pos.split(".")
         cursor_row, cursor_col = cursor_pos
+        if self.viewer is not None:
+            cursor_row = self.viewer.line_number(tk.INSERT) or "?"
         self.text_row_label.config(text=f"Ln: {cursor_row}")
         self.text_col_label.config(text=f"Col: {cursor_col}")
         self.text_box.tag_remove("fake_sel", "1.0", "end")
 
-    def open_recent_file(self, file_path):
+    def open_recent_file(self, file_path, index=None):
         if os.path.exists(file_path):
-            self.current_file_path = file_path
-            self.set_file_name(file_path)
-            with open(self.current_file_path, "r") as file:
-                content = file.read()
-            self.text_box.delete("1.0", tk.END)
-            self.text_box.insert("1.0", content)
-            self.text_box.edit_modified(False)
-            self.update_recent_files(file_path)
-            self.highlight_if_python()
-            self.undo_stack.clear()
-            self.redo_stack.clear()
+            self.load_file(file_path, index)
         else:
             messagebox.showerror(title="File Not Found",message=f"{file_path} does not exist.")
-            self.recent_files.remove(file_path)
-            self.update_recent_files(None)
+            self.session.forget_recent(file_path)
+
+    def open_file_at(self, file_path, index):
+        self.open_recent_file(file_path, index)
+
+    def jump_to(self, index):
+        if self.viewer is not None:
+            self.viewer.go_to_line(split_index(index)[0])
+        else:
+            self.text_box.mark_set("insert", index)
+            self.text_box.see(index)
+        self.text_box.focus_set()
+        self.text_interact()
 
     def update_recent_files(self, file_path):
-        if file_path in self.recent_files:
-            self.recent_files.remove(file_path)
-        if file_path is not None:
-            self.recent_files.insert(0, file_path)
-        self.recent_files = self.recent_files[:5]
+        self.session.touch_recent(file_path)
+
+    def fill_recent_files_menu(self):
         self.recent_files_menu.delete(0, tk.END)
-        for recent_file in self.recent_files:
+        for recent_file in self.session.recent_files():
             self.recent_files_menu.add_command(label=recent_file,command=lambda
             r=recent_file: self.open_recent_file(r))
 
+    def save_session(self, tab):
+        if tab.current_file_path is None or tab.viewer is not None or tab.loader is not None:
+            return
+        self.session.save_file_state(tab.current_file_path, tab.text_box.index(tk.INSERT), tab.text_box.yview()[0],
+                                     tab.python_mode, tab.word_wrap)
+        if tab.content_hash is not None and tab.document.version == tab.content_version:
+            cache = tab.highlighter.export_cache()
+            if cache is not None:
+                self.session.save_tokens(tab.content_hash, cache)
+
+    def restore_session(self, tab, index):
+        state = self.session.file_state(tab.current_file_path)
+        if state is not None: #Applied to the tab itself, it may be opening in the background.
+            if state["python_mode"] != tab.python_mode:
+                self.set_python_mode(tab, state["python_mode"])
+            if state["word_wrap"] != tab.word_wrap:
+                self.set_word_wrap(tab, state["word_wrap"])
+        if tab.highlighter.enabled and tab.content_hash is not None:
+            cache = self.session.tokens(tab.content_hash)
+            if cache is not None:
+                tab.highlighter.restore_cache(cache) #Unchanged file, the cached tags stand in for lexing it again.
+        if index is None and state is not None:
+            tab.text_box.mark_set("insert", state["cursor"])
+            tab.text_box.yview_moveto(state["scroll"])
+            if tab is self.tab:
+                tab.text_box.focus_set()
+                self.text_interact()
+        elif tab is self.tab:
+            self.jump_to(index or "1.0")
+
     def save_word(self, event=None):
-        current_text = self.text_box.get("1.0", "end-1c")
-        if self.undo_stack and self.undo_stack[-1] == current_text:
-            return
-        if len(self.undo_stack) >= self.MAX_UNDO:
-            self.undo_stack.pop(0)
-        self.undo_stack.append(current_text)
-        self.redo_stack.clear()
-
-    def configure_tags(self, theme_colours):
-        self.text_box.tag_configure("comments", foreground=theme_colours["comments"])
-        self.text_box.tag_configure("strings", foreground=theme_colours["strings"])
-        self.text_box.tag_configure("keywords", foreground=theme_colours["keywords"])
-        self.text_box.tag_configure("names", foreground=theme_colours["names"])
-        self.text_box.tag_configure("builtins", foreground=theme_colours["builtins"])
-        self.text_box.tag_configure("self", foreground=theme_colours["self"])
-        self.text_box.tag_configure("dunders", foreground=theme_colours["dunders"])
-        self.text_box.tag_configure("numbers", foreground=theme_colours["numbers"])
-        self.text_box.tag_configure("functions", foreground=theme_colours["functions"])
-
-    def gen_tokens(self):
-        text_content = self.text_box.get("1.0", "end-1c")
-        tokens = []
-        readline = io.StringIO(text_content).readline
-        try:
-            for token in tokenize.generate_tokens(readline):
-                tokens.append(token)
-        except tokenize.TokenError:
-            pass
-        return tokens
+        self.undo_history.checkpoint()
+
+    @staticmethod
+    def configure_tags(text_box, theme_colours):
+        text_box.tag_configure("comments", foreground=theme_colours["comments"])
+        text_box.tag_configure("strings", foreground=theme_colours["strings"])
+        text_box.tag_configure("keywords", foreground=theme_colours["keywords"])
+        text_box.tag_configure("names", foreground=theme_colours["names"])
+        text_box.tag_configure("builtins", foreground=theme_colours["builtins"])
+        text_box.tag_configure("self", foreground=theme_colours["self"])
+        text_box.tag_configure("dunders", foreground=theme_colours["dunders"])
+        text_box.tag_configure("numbers", foreground=theme_colours["numbers"])
+        text_box.tag_configure("functions", foreground=theme_colours["functions"])
+
+    @staticmethod
+    def load_name_tables():
+        if TextEditor.DUNDERS is None:
+            TextEditor.BUILTINS = set(dir(builtins))
+            TextEditor.DUNDERS = get_dunder_methods() #Set last, it is what marks the tables as loaded.
 
     @staticmethod
     def check_names(tok_string,function_next):
+        if TextEditor.DUNDERS is None:
+            TextEditor.load_name_tables()
         if keyword.iskeyword(tok_string):
             if tok_string == "def":
                 function_next = True
@@ -759,57 +4294,105 @@ class TextEditor:
             tag = "names"
         return tag, function_next
 
-    @staticmethod
-    def assign_text_tag(tok_type, tok_string, function_next):
-        tag = None
-        if tok_type == tokenize.COMMENT:
-            tag = "comments"
-        elif tok_type == tokenize.STRING:
-            tag = "strings"
-        elif tok_type == tokenize.NUMBER:
-            tag = "numbers"
-        elif tok_type == tokenize.NAME:
-            tag, function_next = TextEditor.check_names(tok_string,function_next)
-        elif tok_type == tokenize.OP:
-            tag = "op"
-        return tag, function_next
+    def highlight_text(self,event=None, tab=None):
+        highlighter = (tab or self.tab).highlighter
+        if highlighter.enabled: #Text mode tabs stay plain, only the mode switches turn highlighting on.
+            highlighter.refresh()
 
-    def highlight_text(self,event=None):
-        self.clear_highlighting()
-        tokens = self.gen_tokens()
-        function_next = False
-        for index, token in enumerate(tokens):
-            tok_string = token.string
-            tok_type = token.type
-            start_line, start_col = token.start
-            end_line, end_col = token.end
-            tag, function_next = TextEditor.assign_text_tag(tok_type,tok_string,function_next)
-            if index > 0:
-                prev_token = tokens[index-1]
-                if tag == "builtins" and prev_token.type == tokenize.OP and prev_token.string == ".":
-                    tag = "names"
-            if tag:
-                start_index = f"{start_line}.{start_col}"
-                end_index = f"{end_line}.{end_col}"
-                self.text_box.tag_add(tag, start_index, end_index)
-
-    def clear_highlighting(self):
-        for tag in self.text_box.tag_names():
-            self.text_box.tag_remove(tag, "1.0", "end")
+    def start_highlighting(self, tab):
+        if not tab.highlighter.enabled:
+            tab.highlighter.reset()
+        tab.highlighter.refresh()
 
     def close(self,event=None):
-        file_title = self.window.title()
-        if file_title.startswith("*"):
-            response = messagebox.askyesnocancel("Save Changes?", "Do you want to save changes?")
-            if response:
-                saved = self.save()
-                if saved:
-                    self.window.destroy()
-            elif response is False:
-                self.window.destroy()
-        else:
-            self.window.destroy()
+        for tab in list(self.tabs):
+            if not self.finish_saving(tab):
+                self.select_tab(tab)
+                return
+            if not tab.modified:
+                continue
+            self.select_tab(tab)
+            response = messagebox.askyesnocancel("Save Changes?", f"Do you want to save changes to {tab.file_name}?")
+            if response is None or (response and not self.save()):
+                return
+            if not self.finish_saving(tab):
+                return
+        self.destroy()
+
+    def destroy(self):
+        if self.instrumentation.profiler is not None:
+            self.instrumentation.stop_profile() #Keep what was recorded rather than losing it on exit.
+        for tab in self.tabs:
+            self.save_session(tab)
+            tab.close()
+        self.watcher.close()
+        self.window.destroy()
+        self.instrumentation.uninstall() #tkinter.CallWrapper is module wide, other Tk apps in the process get it back.
+
+    def offer_recovery(self):
+        for journal_path in EditJournal.orphaned_journals():
+            try:
+                header, records = EditJournal.read(journal_path)
+            except OSError:
+                continue
+            #A checkpoint holds the whole text and no records, it is just as much unsaved work.
+            if header is not None and (records or header.get("text") is not None):
+                name = os.path.basename(header["path"]) if header["path"] else "untitled"
+                message = f"Unsaved changes to {name} were found from a previous session. Recover them?"
+                if messagebox.askyesno("Recover Unsaved Changes?", message):
+                    if not self.tab.is_blank():
+                        self.new_file() #Each recovered document gets its own tab.
+                    if not self.recover(header, records):
+                        messagebox.showerror("Recovery Failed", f"{header['path']} has changed since the edits were made.\n"
+                                                                f"They were kept in {journal_path}.")
+                        continue
+            os.remove(journal_path)
+
+    def recover(self, header, records):
+        base_text = EditJournal.base_text(header)
+        if base_text is None:
+            return False
+        self.journal.paused = True
+        self.text_box.delete("1.0", tk.END)
+        self.text_box.insert("1.0", base_text)
+        for record in records:
+            if record[0] == "i":
+                self.text_box.insert(record[1], record[2])
+            else:
+                self.text_box.delete(record[1], record[2])
+        self.journal.paused = False
+        if header["path"]:
+            self.current_file_path = header["path"]
+            self.set_file_name(header["path"])
+            self.update_recent_files(header["path"])
+            self.highlight_if_python(self.tab)
+        self.undo_history.clear()
+        self.journal.reset(header["path"])
+        self.journal.snapshot() #The recovered text only exists in memory, so the new journal starts from a copy of it.
+        return True
+
+def process_age():
+    #Seconds since the interpreter started, so the imports count towards startup too. Linux only.
+    try:
+        with open("/proc/self/stat") as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, AttributeError, ValueError, IndexError):
+        return None
+
+def check_startup(budget_ms):
+    age = process_age()
+    started = time.perf_counter() - age if age is not None else LOADED
+    text_editor = TextEditor(recover=False) #A recovery prompt would wait on the user.
+    text_editor.window.update() #Maps and draws the first window.
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"Time to first window: {elapsed_ms:.0f} ms (budget {budget_ms} ms)")
+    text_editor.destroy()
+    return elapsed_ms <= budget_ms
 
 if __name__ == "__main__":
+    if "--startup-check" in sys.argv:
+        arguments = sys.argv[sys.argv.index("--startup-check") + 1:]
+        sys.exit(0 if check_startup(int(arguments[0]) if arguments else TextEditor.STARTUP_BUDGET_MS) else 1)
     text_editor = TextEditor()
     text_editor.run_editor()